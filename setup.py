@@ -11,10 +11,15 @@ setup(
         url='http://www.github.com/lygaret/django-tumblog',
         packages=[
             'tumblog',
+            'tumblog.management',
+            'tumblog.management.commands',
             'tumblog.models',
             'tumblog.templatetags',
             'tumblog.urls',
             'tumblog.views',
             'tumblog.tools',
-        ]
+            'tumblog.tools.management',
+            'tumblog.tools.management.commands',
+        ],
+        package_data={'tumblog': ['sql/*.sql']},
 )
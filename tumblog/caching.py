@@ -0,0 +1,88 @@
+"""
+Per-blog caches: the Blog instances themselves, looked up by slug on every
+public request, and the blog's cache state: when its public pages last
+changed. Both are dropped by tumblog.listeners whenever a post, photo or
+the blog itself changes, and by tumblog.scheduler when a scheduled post
+goes live.
+"""
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import Http404
+
+from tumblog.models import Blog, Post
+from tumblog.utils import LRUCache
+
+# upper bound, in case something changes behind the listeners' back
+BLOG_STATE_TIMEOUT = 60 * 60
+BLOG_CACHE_TIMEOUT = 60 * 60
+
+# the in-process cache can't hear about changes made in other processes,
+# so its entries only live for a short while
+BLOG_LOCAL_SIZE = getattr(settings, 'TUMBLOG_BLOG_CACHE_SIZE', 100)
+BLOG_LOCAL_TIMEOUT = getattr(settings, 'TUMBLOG_BLOG_CACHE_TIMEOUT', 60)
+
+_blogs = LRUCache(BLOG_LOCAL_SIZE, BLOG_LOCAL_TIMEOUT)
+
+def _blog_key(slug):
+    return 'tumblog.blog.%s' % slug
+
+def get_blog(slug):
+    """
+    The blog with the given slug, from the in-process cache, the shared
+    cache or the database, in that order. Raises Http404 for unknown slugs.
+    """
+    blog = _blogs.get(slug)
+    if blog is not None:
+        return blog
+
+    blog = cache.get(_blog_key(slug))
+    if blog is None:
+        try:
+            blog = Blog.objects.get(slug = slug)
+        except Blog.DoesNotExist:
+            raise Http404
+        cache.set(_blog_key(slug), blog, BLOG_CACHE_TIMEOUT)
+
+    _blogs.set(slug, blog)
+    return blog
+
+def _state_key(slug):
+    return 'tumblog.blog.%s.state' % slug
+
+def stamp(dt):
+    """ Compact, cache key friendly form of a datetime """
+    if dt is None:
+        return '0'
+    return "%s%06d" % (dt.strftime('%Y%m%d%H%M%S'), dt.microsecond)
+
+def blog_state(slug):
+    """
+    Returns {'last_modified': ...} for the blog, or None if there's no
+    such blog.
+    """
+    key = _state_key(slug)
+    state = cache.get(key)
+    if state is not None:
+        return state
+
+    blog = Blog.objects.filter(slug = slug).values_list('pk', 'modtime')
+    if not blog:
+        return None
+    blog_id, blog_modtime = blog[0]
+
+    stamps = Post.objects.filter(blog = blog_id).aggregate(modtime = Max('modtime'))
+    stamps.update(Post.objects.filter(blog = blog_id, live = True).aggregate(pubtime = Max('pubtime')))
+
+    changes = [stamp for stamp in (blog_modtime, stamps['modtime'], stamps['pubtime']) if stamp]
+    state = {
+        'last_modified': changes and max(changes) or datetime.now(),
+    }
+    cache.set(key, state, BLOG_STATE_TIMEOUT)
+    return state
+
+def invalidate_blog(slug):
+    _blogs.delete(slug)
+    cache.delete(_blog_key(slug))
+    cache.delete(_state_key(slug))
@@ -0,0 +1,104 @@
+"""
+Atom and RSS feeds of a blog's latest posts, optionally by tag. Feeds are
+cached under the blog's last change (see tumblog.caching), and rebuilt by
+tumblog.listeners as soon as a post is published, so a poll is a cache read.
+"""
+import logging
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.urlresolvers import reverse, NoReverseMatch
+from django.utils import feedgenerator
+from tagging.models import TaggedItem
+
+from tumblog.caching import blog_state, stamp
+from tumblog.models.summaries import tag_names
+from tumblog.rendering import render_post
+
+FEED_LENGTH = getattr(settings, 'TUMBLOG_FEED_LENGTH', settings.PAGINATION_COUNT)
+FEED_CACHE_TIMEOUT = getattr(settings, 'TUMBLOG_FEED_CACHE_TIMEOUT', 60 * 60 * 24)
+PRECOMPUTE_FEEDS = getattr(settings, 'TUMBLOG_PRECOMPUTE_FEEDS', True)
+
+FEED_TYPES = {
+    'atom': feedgenerator.Atom1Feed,
+    'rss': feedgenerator.Rss201rev2Feed,
+}
+
+def _absolute(path):
+    return 'http://%s%s' % (Site.objects.get_current().domain, path)
+
+def feed_cache_key(slug, format, tag, last_modified):
+    return 'tumblog.feed.%s.%s.%s.%s' % (slug, format, tag or '', stamp(last_modified))
+
+def build_feed(blog, format, tag=None):
+    """ Generate the feed document, rendering posts with their templates """
+    posts = blog.posts
+    if tag:
+        posts = TaggedItem.objects.get_by_model(posts, tag)
+        link = reverse('tumblog.tag', kwargs = {'blogslug': blog.slug, 'tag': tag})
+        feed_url = reverse('tumblog.tag.feed', kwargs = {'blogslug': blog.slug, 'tag': tag, 'format': format})
+        title = "%s: %s" % (blog.title, tag)
+    else:
+        link = reverse('tumblog.index', kwargs = {'blogslug': blog.slug})
+        feed_url = reverse('tumblog.feed', kwargs = {'blogslug': blog.slug, 'format': format})
+        title = blog.title
+
+    # tagging hands back an EmptyQuerySet for unknown tags
+    if hasattr(posts, 'with_photos'):
+        posts = posts.with_photos()
+
+    feed = FEED_TYPES[format](
+        title = title,
+        link = _absolute(link),
+        description = blog.description_raw,
+        feed_url = _absolute(feed_url),
+    )
+
+    for post in posts[:FEED_LENGTH]:
+        post.blog = blog
+        url = _absolute(post.get_absolute_url())
+        feed.add_item(
+            title = post.title,
+            link = url,
+            description = render_post(blog, post),
+            pubdate = post.pubtime,
+            unique_id = url,
+            categories = tag_names(post.tags),
+        )
+
+    return feed.writeString('utf-8')
+
+def get_feed(blog, format, tag=None, state=None):
+    """ The feed document, from the cache if it's current """
+    if state is None:
+        state = blog_state(blog.slug)
+
+    key = feed_cache_key(blog.slug, format, tag, state['last_modified'])
+    data = cache.get(key)
+    if data is None:
+        data = build_feed(blog, format, tag)
+        cache.set(key, data, FEED_CACHE_TIMEOUT)
+    return data
+
+def _has_feed(blog, tag):
+    """ Whether the tag fits the tag URLs, unlike eg. 'web2.0' """
+    try:
+        reverse('tumblog.tag.feed', kwargs = {'blogslug': blog.slug, 'tag': tag, 'format': 'atom'})
+    except NoReverseMatch:
+        return False
+    return True
+
+def refresh_feeds(blog, tags=()):
+    """
+    Build the blog's feeds, and those of the given tags, ahead of polls.
+    This runs after posts are saved, imported or put live, so failures are
+    logged rather than raised; the feeds get built on the next poll instead.
+    """
+    try:
+        state = blog_state(blog.slug)
+        tags = [tag for tag in tags if _has_feed(blog, tag)]
+        for format in FEED_TYPES:
+            for tag in [None] + tags:
+                get_feed(blog, format, tag, state)
+    except Exception:
+        logging.exception("precomputing the feeds of %s failed" % blog.slug)
@@ -0,0 +1,48 @@
+from django.db import models
+from django.db.models import signals
+
+from tumblog import markup
+
+class MarkdownTextField(models.TextField):
+    """
+    Holds the Markdown rendering of another field (prepopulate_from), made
+    on save. With TUMBLOG_DEFER_MARKDOWN on, save stores the escaped raw
+    text instead and queues the object for the run_jobs command. Saves
+    which leave the raw text as it was loaded don't render anything.
+    """
+    def __init__(self, *args, **kwargs):
+        self.raw_field = kwargs.pop('prepopulate_from')
+        kwargs.setdefault('blank', True)
+        super(MarkdownTextField, self).__init__(*args, **kwargs)
+
+    def contribute_to_class(self, cls, name):
+        super(MarkdownTextField, self).contribute_to_class(cls, name)
+        signals.post_init.connect(self._remember_raw, sender = cls,
+                dispatch_uid = 'tumblog.markdown.init.%s.%s' % (cls.__name__, name))
+        signals.post_save.connect(self._queue_rendering, sender = cls,
+                dispatch_uid = 'tumblog.markdown.%s.%s' % (cls.__name__, name))
+
+    def _remember_raw(self, sender, instance, **kwargs):
+        if instance.pk is not None:
+            instance.__dict__.setdefault('_markdown_raw', {})[self.attname] = getattr(instance, self.raw_field)
+
+    def pre_save(self, model_instance, add):
+        raw = getattr(model_instance, self.raw_field) or ''
+        remembered = model_instance.__dict__.setdefault('_markdown_raw', {})
+        if not add and remembered.get(self.attname) == raw and getattr(model_instance, self.attname):
+            return getattr(model_instance, self.attname)
+        remembered[self.attname] = raw
+
+        if markup.DEFER_MARKDOWN:
+            value = markup.placeholder(raw)
+            model_instance._markdown_pending = True
+        else:
+            value = markup.render_markdown(raw)
+        setattr(model_instance, self.attname, value)
+        return value
+
+    def _queue_rendering(self, sender, instance, **kwargs):
+        if getattr(instance, '_markdown_pending', False):
+            from tumblog.tasks import enqueue
+            enqueue('markdown', instance)
+            instance._markdown_pending = False
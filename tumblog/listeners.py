@@ -0,0 +1,113 @@
+"""
+Signal handlers keeping the denormalized per-blog summaries (TagCount,
+ArchiveMonth) and the caches in step with the posts. Only live posts are
+counted; scheduled ones are queued, and counted by tumblog.scheduler once
+they go live.
+"""
+from datetime import datetime
+from django.db.models import signals
+
+from tumblog.models import Blog, Post, Photo
+from tumblog.models.summaries import published_state, move_post
+from tumblog.caching import invalidate_blog
+from tumblog.feeds import PRECOMPUTE_FEEDS, refresh_feeds
+from tumblog.scheduler import schedule
+
+def _invalidate_blog_id(blog_id):
+    for slug in Blog.objects.filter(pk = blog_id).values_list('slug', flat = True):
+        invalidate_blog(slug)
+
+def _touch_blog_id(blog_id):
+    """ Move the blog's cache state on when a post leaves it, as no post modtime will """
+    Blog.objects.filter(pk = blog_id).update(modtime = datetime.now())
+    _invalidate_blog_id(blog_id)
+
+def remember_published_state(sender, instance, **kwargs):
+    """ Stash the stored state of a post about to be saved """
+    if not isinstance(instance, Post):
+        return
+
+    instance._published_state = None
+    if instance.pk:
+        stored = Post.objects.filter(pk = instance.pk).values_list('blog', 'tags', 'pubtime', 'live')
+        if stored:
+            instance._published_state = published_state(*stored[0])
+
+def update_summaries(sender, instance, **kwargs):
+    """
+    Move the post's counts from its previous state to its new one, and
+    drop the cached state of the blog(s) involved.
+    """
+    if not isinstance(instance, Post):
+        return
+
+    old = getattr(instance, '_published_state', None)
+    new = published_state(instance.blog_id, instance.tags, instance.pubtime, instance.live)
+    instance._published_state = new
+    move_post(old, new)
+
+    if not instance.live and instance.pubtime is not None:
+        schedule(instance)
+    _invalidate_blog_id(instance.blog_id)
+    if old and old[0] != instance.blog_id:
+        _touch_blog_id(old[0])
+
+def precompute_feeds(sender, instance, **kwargs):
+    """ Build the feeds of the blog a post was just published in """
+    if not isinstance(instance, Post) or not PRECOMPUTE_FEEDS:
+        return
+
+    state = getattr(instance, '_published_state', None)
+    if state is not None:
+        refresh_feeds(Blog.objects.get(pk = instance.blog_id), state[1])
+
+def forget_post(sender, instance, **kwargs):
+    """ Remove a deleted post from the summaries and caches """
+    # deleting a post sends a signal for each of its model and its parents;
+    # the Post one is the only one we can count on seeing exactly once.
+    if sender is not Post:
+        return
+
+    move_post(published_state(instance.blog_id, instance.tags, instance.pubtime, instance.live), None)
+    _touch_blog_id(instance.blog_id)
+
+def touch_post(post_id):
+    """ Mark a post as changed for the caches, without going through save """
+    posts = Post.objects.filter(pk = post_id)
+    for blog_id in posts.values_list('blog', flat = True):
+        posts.update(modtime = datetime.now())
+        _invalidate_blog_id(blog_id)
+
+def touch(instance):
+    """ Mark a blog, post or photo as changed, for the caches """
+    if isinstance(instance, Post):
+        touch_post(instance.pk)
+    elif isinstance(instance, Photo):
+        touch_post(instance.post_id)
+    elif isinstance(instance, Blog):
+        Blog.objects.filter(pk = instance.pk).update(modtime = datetime.now())
+        invalidate_blog(instance.slug)
+
+def touch_photo_post(sender, instance, **kwargs):
+    """ A photo changing changes its post, as far as caches are concerned """
+    touch_post(instance.post_id)
+
+def remember_blog_slug(sender, instance, **kwargs):
+    instance._stored_slugs = []
+    if instance.pk:
+        instance._stored_slugs = list(Blog.objects.filter(pk = instance.pk).values_list('slug', flat = True))
+
+def invalidate_blog_pages(sender, instance, **kwargs):
+    """ Drop the cached state under the blog's slug, and its old one """
+    for slug in set(getattr(instance, '_stored_slugs', []) + [instance.slug]):
+        invalidate_blog(slug)
+
+signals.pre_save.connect(remember_published_state, dispatch_uid = 'tumblog.remember_published_state')
+signals.post_save.connect(update_summaries, dispatch_uid = 'tumblog.update_summaries')
+signals.post_save.connect(precompute_feeds, dispatch_uid = 'tumblog.precompute_feeds')
+signals.post_delete.connect(forget_post, dispatch_uid = 'tumblog.forget_post')
+signals.post_save.connect(touch_photo_post, sender = Photo, dispatch_uid = 'tumblog.touch_photo_post')
+signals.post_delete.connect(touch_photo_post, sender = Photo, dispatch_uid = 'tumblog.touch_photo_post.delete')
+signals.pre_save.connect(remember_blog_slug, sender = Blog, dispatch_uid = 'tumblog.remember_blog_slug')
+signals.post_save.connect(invalidate_blog_pages, sender = Blog, dispatch_uid = 'tumblog.invalidate_blog_pages')
+signals.post_delete.connect(invalidate_blog_pages, sender = Blog, dispatch_uid = 'tumblog.invalidate_blog_pages.delete')
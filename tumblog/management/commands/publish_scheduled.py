@@ -0,0 +1,21 @@
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+
+from tumblog.tasks import run_queued
+
+class Command(NoArgsCommand):
+    help = "Put scheduled posts live once their pubtime has passed."
+    option_list = NoArgsCommand.option_list + (
+        make_option('--loop', type = 'int', dest = 'loop', metavar = 'SECONDS',
+            help = 'Keep running, checking for due posts every SECONDS.'),
+    )
+
+    def handle_noargs(self, **options):
+        while True:
+            done = run_queued(tasks = ['publish'])
+            if done and int(options.get('verbosity', 1)) > 0:
+                print "Ran %d publish jobs" % done
+            if not options.get('loop'):
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from tumblog.models import Blog, TagCount, ArchiveMonth
+from tumblog.scheduler import resync
+
+class Command(BaseCommand):
+    help = "Rebuild the per-blog published state, tag counts and archive months from the posts' pubtimes."
+    args = '[blogslug ...]'
+
+    def handle(self, *slugs, **options):
+        blogs = Blog.objects.all()
+        if slugs:
+            blogs = blogs.filter(slug__in = slugs)
+
+        for blog in blogs:
+            resync(blog)
+            TagCount.objects.rebuild(blog)
+            ArchiveMonth.objects.rebuild(blog)
+            if int(options.get('verbosity', 1)) > 0:
+                print "Rebuilt summaries for %s" % blog.slug
@@ -0,0 +1,35 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+
+from tumblog.models import Photo
+from tumblog.thumbnails import generate_thumbnails, thumbnail_bytes
+
+class Command(NoArgsCommand):
+    help = "Regenerate the thumbnails of every photo with the current presets."
+    option_list = NoArgsCommand.option_list + (
+        make_option('--processes', type = 'int', dest = 'processes',
+            help = 'Worker processes to use, defaults to one per core.'),
+        make_option('--report', action = 'store_true', dest = 'report', default = False,
+            help = 'Report the bytes saved (or not) per preset.'),
+    )
+
+    def handle_noargs(self, **options):
+        before, after = {}, {}
+        ids = list(Photo.objects.values_list('pk', flat = True))
+        for start in xrange(0, len(ids), 100):
+            photos = list(Photo.objects.filter(pk__in = ids[start:start + 100]))
+            if options['report']:
+                _add(before, thumbnail_bytes(photos))
+            _add(after, generate_thumbnails(photos, options.get('processes')))
+
+        if int(options.get('verbosity', 1)) > 0:
+            print "Regenerated thumbnails for %d photos" % len(ids)
+
+        if options['report']:
+            for preset in sorted(set(before.keys() + after.keys())):
+                old, new = before.get(preset, 0), after.get(preset, 0)
+                print "%-12s %12d -> %12d bytes, saved %d" % (preset, old, new, old - new)
+
+def _add(totals, more):
+    for preset, count in more.items():
+        totals[preset] = totals.get(preset, 0) + count
@@ -0,0 +1,17 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+
+from tumblog.markup import markdown_models, render_all
+
+class Command(NoArgsCommand):
+    help = "Re-render the Markdown fields of every blog, post and photo, eg. after a Markdown extension change."
+    option_list = NoArgsCommand.option_list + (
+        make_option('--processes', type = 'int', dest = 'processes',
+            help = 'Worker processes to use, defaults to one per core.'),
+    )
+
+    def handle_noargs(self, **options):
+        for model in markdown_models():
+            count = render_all(model, options.get('processes'))
+            if int(options.get('verbosity', 1)) > 0:
+                print "Rendered %d %s" % (count, model._meta.verbose_name_plural)
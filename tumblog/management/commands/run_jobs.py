@@ -0,0 +1,23 @@
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+
+from tumblog.tasks import run_queued
+
+class Command(NoArgsCommand):
+    help = "Run the jobs deferred to the tumblog job queue."
+    option_list = NoArgsCommand.option_list + (
+        make_option('--processes', type = 'int', dest = 'processes',
+            help = 'Worker processes to use, defaults to one per core.'),
+        make_option('--loop', type = 'int', dest = 'loop', metavar = 'SECONDS',
+            help = 'Keep running, polling the queue every SECONDS.'),
+    )
+
+    def handle_noargs(self, **options):
+        while True:
+            done = run_queued(processes = options.get('processes'))
+            if done and int(options.get('verbosity', 1)) > 0:
+                print "Ran %d jobs" % done
+            if not options.get('loop'):
+                break
+            time.sleep(options['loop'])
@@ -1,32 +1,117 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import islice
 from django.db import models
+from django.db.models.query import QuerySet
+from django.contrib.contenttypes.models import ContentType
 from tagging.models import TaggedItem
 
+def resolve_subclasses(posts):
+    """
+    Swap a list of bare Post rows for their concrete subclass instances,
+    using one query per post type. Order is preserved; rows whose concrete
+    instance can't be found are handed back unchanged.
+    """
+    ids_by_type = {}
+    for post in posts:
+        ids_by_type.setdefault(post.post_type_id, []).append(post.pk)
+
+    concrete = {}
+    for type_id, ids in ids_by_type.items():
+        model = ContentType.objects.get_for_id(type_id).model_class()
+        if model is not None:
+            concrete.update(model._default_manager.in_bulk(ids))
+
+    return [concrete.get(post.pk, post) for post in posts]
+
+def attach_photos(posts):
+    """
+    Load the photos of every photo post in the list with a single query,
+    and hang them on the posts (see PhotoPost.photo_list).
+    """
+    from tumblog.models import Photo, PhotoPost
+
+    photo_posts = dict((post.pk, post) for post in posts if isinstance(post, PhotoPost))
+    if not photo_posts:
+        return posts
+
+    for post in photo_posts.values():
+        post._photo_cache = []
+    for photo in Photo.objects.filter(post__in = photo_posts.keys()).order_by('id'):
+        photo_posts[photo.post_id]._photo_cache.append(photo)
+    return posts
+
+def date_range(year, month=None, day=None):
+    """ Half-open [start, end) datetime range of a year, month or day """
+    if month is None:
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    elif day is None:
+        if month == 12:
+            return datetime(year, 12, 1), datetime(year + 1, 1, 1)
+        return datetime(year, month, 1), datetime(year, month + 1, 1)
+    else:
+        start = datetime(year, month, day)
+        return start, start + timedelta(days = 1)
+
+class PostQuerySet(QuerySet):
+    """
+    QuerySet for posts, which can optionally yield the concrete post types
+    (TextPost, LinkPost, ...) rather than Post instances.
+    """
+    _with_subclasses = False
+    _with_photos = False
+
+    def _clone(self, klass=None, setup=False, **kwargs):
+        kwargs.setdefault('_with_subclasses', self._with_subclasses)
+        kwargs.setdefault('_with_photos', self._with_photos)
+        return super(PostQuerySet, self)._clone(klass, setup, **kwargs)
+
+    def with_subclasses(self):
+        """ Yield concrete post instances, batch-resolved per post type """
+        return self._clone(_with_subclasses = True)
+
+    def with_photos(self):
+        """ Like with_subclasses(), also prefetching photo post photos """
+        return self._clone(_with_subclasses = True, _with_photos = True)
+
+    def by_date(self, year, month=None, day=None):
+        """
+        Posts in the given year, month or day. This is a plain range on
+        pubtime, which unlike the __year/__month/__day lookups can use the
+        (blog, live, pubtime) index.
+        """
+        start, end = date_range(year, month, day)
+        return self.filter(pubtime__gte = start, pubtime__lt = end)
+
+    def iterator(self):
+        rows = super(PostQuerySet, self).iterator()
+        if not self._with_subclasses:
+            return rows
+        return self._iter_subclasses(rows)
+
+    def _iter_subclasses(self, rows, chunk_size=100):
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            chunk = resolve_subclasses(chunk)
+            if self._with_photos:
+                attach_photos(chunk)
+            for post in chunk:
+                yield post
+
 class PublishedPostManager(models.Manager):
     """
     Only show published posts. This is the default manager for posts.
     """
     def get_query_set(self):
-        return super(PublishedPostManager, self).get_query_set().filter(pubtime__lte = datetime.now())
+        return PostQuerySet(self.model).filter(live = True)
+
+    def with_subclasses(self):
+        return self.get_query_set().with_subclasses()
 
     def by_date(self, year, month=None, day=None):
         """ Return all posts in the given time period """
-        if month is None:
-            return self.filter( pubtime__lt = datetime(year + 1, 1, 1), \
-                                pubtime__gte = datetime(year, 1, 1) )
-        elif day is None:
-            if (month == 12):
-                next_year = year + 1
-                next_month = 1
-            else:
-                next_year = year
-                next_month = month + 1
-
-            return self.filter( pubtime__lt = datetime(next_year, next_month, 1), \
-                                pubtime__gte = datetime(year, month, 1) )
-        else:
-            return self.filter( pubtime__lte = datetime(year, month, day, 23, 59), \
-                                pubtime__gte = datetime(year, month, day, 0, 0) )
+        return self.get_query_set().by_date(year, month, day)
 
     def by_tag(self, tagname):
         """ Return all posts tagged with any of the tags in the taglist """
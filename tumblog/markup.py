@@ -0,0 +1,104 @@
+"""
+Markdown rendering of MarkdownTextFields, in the request or deferred to
+the job queue (TUMBLOG_DEFER_MARKDOWN), and in bulk across worker
+processes. Renderings are memoized by a hash of the raw text and the
+renderer configuration, since many raw texts (citations, imported link
+descriptions) repeat.
+"""
+import markdown as markdown_module
+from django.conf import settings
+from django.db.models import get_models
+from django.utils.hashcompat import md5_constructor
+from django.utils.html import escape, linebreaks
+from markdown import markdown
+
+from tumblog.utils import LRUCache
+from tumblog.workers import parallel_map
+
+MARKDOWN_EXTENSIONS = getattr(settings, 'TUMBLOG_MARKDOWN_EXTENSIONS', [])
+MARKDOWN_CACHE_SIZE = getattr(settings, 'TUMBLOG_MARKDOWN_CACHE_SIZE', 1000)
+DEFER_MARKDOWN = getattr(settings, 'TUMBLOG_DEFER_MARKDOWN', False)
+
+_renderer_config = repr((getattr(markdown_module, 'version', ''), MARKDOWN_EXTENSIONS))
+_rendered = LRUCache(MARKDOWN_CACHE_SIZE)
+
+def _render_key(raw):
+    if isinstance(raw, unicode):
+        raw = raw.encode('utf-8')
+    return md5_constructor(_renderer_config + raw).hexdigest()
+
+def _render(raw):
+    return markdown(raw, MARKDOWN_EXTENSIONS)
+
+def render_markdown(raw):
+    """ Markdown rendering of raw, memoized """
+    key = _render_key(raw)
+    html = _rendered.get(key)
+    if html is None:
+        html = _render(raw)
+        _rendered.set(key, html)
+    return html
+
+def render_many(raws, processes=None):
+    """
+    Render a list of raw texts, rendering each distinct text not already
+    memoized just once, in a pool of worker processes.
+    """
+    keys = [_render_key(raw) for raw in raws]
+    rendered = {}
+    missing = {}
+    for key, raw in zip(keys, raws):
+        if key in rendered or key in missing:
+            continue
+        html = _rendered.get(key)
+        if html is None:
+            missing[key] = raw
+        else:
+            rendered[key] = html
+
+    missing_keys = missing.keys()
+    htmls = parallel_map(_render, [missing[key] for key in missing_keys], processes)
+    for key, html in zip(missing_keys, htmls):
+        rendered[key] = html
+        _rendered.set(key, html)
+
+    return [rendered[key] for key in keys]
+
+def placeholder(raw):
+    """ Stand-in for the rendered text until the job queue gets to it """
+    return linebreaks(escape(raw))
+
+def markdown_fields(model):
+    from tumblog.fields import MarkdownTextField
+    return [field for field in model._meta.local_fields if isinstance(field, MarkdownTextField)]
+
+def markdown_models():
+    """ All tumblog models with Markdown rendered fields """
+    from tumblog import models
+    return [model for model in get_models(models) if markdown_fields(model)]
+
+def render_objects(model, objects, processes=None):
+    """
+    Render the Markdown fields of the objects in a pool of worker
+    processes, and store the results without going through save().
+    """
+    from tumblog.listeners import touch
+
+    fields = markdown_fields(model)
+    objects = list(objects)
+    raws = [getattr(obj, field.raw_field) or '' for obj in objects for field in fields]
+    rendered = iter(render_many(raws, processes))
+
+    for obj in objects:
+        values = dict((field.attname, rendered.next()) for field in fields)
+        model._default_manager.filter(pk = obj.pk).update(**values)
+        touch(obj)
+    return len(objects)
+
+def render_all(model, processes=None, chunk_size=500):
+    """ Re-render every object of the model, eg. after an extension change """
+    ids = list(model._default_manager.values_list('pk', flat = True))
+    for start in xrange(0, len(ids), chunk_size):
+        chunk = model._default_manager.filter(pk__in = ids[start:start + chunk_size])
+        render_objects(model, chunk, processes)
+    return len(ids)
@@ -1,3 +1,7 @@
 from blog import *
 from post import *
 from posttypes import *
+from summaries import *
+from jobs import *
+
+import tumblog.listeners
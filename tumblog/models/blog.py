@@ -1,14 +1,13 @@
 from django.db import models
-from autofields.fields import AutoMarkdownTextField
-from tagging.models import Tag
-from datetime import datetime
+from tumblog.fields import MarkdownTextField
 
 class Blog(models.Model):
     """ Tumblog Model """
     slug            = models.SlugField()
     title           = models.CharField(max_length = 200)
     description_raw = models.TextField()
-    description     = AutoMarkdownTextField(prepopulate_from = "description_raw")
+    description     = MarkdownTextField(prepopulate_from = "description_raw")
+    modtime         = models.DateTimeField(auto_now = True, null = True)
 
     class Meta:
         app_label   = 'tumblog'
@@ -18,15 +17,19 @@ class Blog(models.Model):
 
     @property
     def tags(self):
-        tags = Tag.objects.usage_for_queryset(self.post_set.all(), counts = True)
-        tags.sort(lambda x, y: cmp(y.count, x.count))
+        """ Tags used by the published posts, most used first, with counts """
+        tags = []
+        for tag_count in self.tag_counts.filter(count__gt = 0).select_related('tag'):
+            tag_count.tag.count = tag_count.count
+            tags.append(tag_count.tag)
         return tags
 
     @property
     def archive_months(self):
-        return self.posts.dates('pubtime', 'month', order="DESC")
+        """ ArchiveMonths with published posts, newest first """
+        return self.month_counts.filter(post_count__gt = 0)
 
     @property
     def posts(self):
-        return self.post_set.filter(pubtime__lte = datetime.now())
+        return self.post_set.filter(live = True)
 
@@ -0,0 +1,25 @@
+from django.db import models
+from django.contrib.contenttypes import generic
+from django.contrib.contenttypes.models import ContentType
+
+class QueuedJob(models.Model):
+    """
+    A task deferred out of the request for an object, see tumblog.tasks.
+    Run by the run_jobs command.
+    """
+    task            = models.CharField(max_length = 50)
+    content_type    = models.ForeignKey(ContentType)
+    object_id       = models.PositiveIntegerField()
+    queued_at       = models.DateTimeField(auto_now_add = True)
+    # not before this time, if given
+    run_at          = models.DateTimeField(null = True, blank = True, db_index = True)
+
+    object          = generic.GenericForeignKey()
+
+    class Meta:
+        app_label   = 'tumblog'
+        ordering    = ('queued_at',)
+        unique_together = (('task', 'content_type', 'object_id'),)
+
+    def __unicode__(self):
+        return "%s: %s #%d" % (self.task, self.content_type, self.object_id)
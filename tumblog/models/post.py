@@ -17,7 +17,10 @@ class Post(models.Model):
     author          = models.ForeignKey(User, blank=True, null=True)
     slug            = AutoSlugField(prepopulate_from = 'title', unique = True)
     tags            = TagField()
-    pubtime         = models.DateTimeField(null = True, blank = True)
+    pubtime         = models.DateTimeField(null = True, blank = True, db_index = True)
+    # whether the post is published; scheduled posts are put live at
+    # their pubtime by tumblog.scheduler
+    live            = models.BooleanField(default = False, db_index = True, editable = False)
 
     blog            = models.ForeignKey(Blog)
 
@@ -29,7 +32,7 @@ class Post(models.Model):
 
     class Meta:
         app_label   = 'tumblog'
-        ordering    = ('-pubtime',)
+        ordering    = ('-pubtime', '-id')
 
     def __unicode__(self):
         return "%s: (published: %s)" % (self.title, self.pubtime.date if self.pubtime else "not published")
@@ -37,25 +40,42 @@ class Post(models.Model):
     def save(self, *args, **kwargs):
         if not self.pk:
             self.post_type = ContentType.objects.get_for_model(type(self))
-        import pdb; pdb.set_trace()
+        self.live = self.pubtime is not None and self.pubtime <= datetime.now()
         super(Post, self).save(*args, **kwargs)
 
+    @permalink
+    def get_absolute_url(self):
+        return ('tumblog.post', (), {
+            'blogslug': self.blog.slug,
+            'year': self.pubtime.strftime('%Y'),
+            'month': self.pubtime.strftime('%m'),
+            'day': self.pubtime.strftime('%d'),
+            'slug': self.slug,
+        })
+
     def get_tags(self):
         return Tag.objects.get_for_object(self)
 
     @property
     def inner_post(self):
-        return self.post_type.get_object_for_this_type(id = self.id)
+        if type(self) is not Post:
+            # already the concrete post, eg. from with_subclasses()
+            return self
+        if not hasattr(self, '_inner_post_cache'):
+            self._inner_post_cache = self.post_type.get_object_for_this_type(id = self.id)
+        return self._inner_post_cache
 
     @property
     def template_name(self):
-        return "tumblog/post_%s.html" % self.post_type.model
+        # get_for_id is cached, unlike following the post_type relation
+        return "tumblog/post_%s.html" % ContentType.objects.get_for_id(self.post_type_id).model
 
     def publish(self, publish_time = None):
         """
         Publish is basically a wrapper for save, which adjusts the
         recorded publish time on the post. If the publish_time parameter
-        is given, then the post will be "published" after that time. If
+        is given, then the post will be "published" after that time: it is
+        saved as scheduled, and a job is queued to put it live then. If
         publish_time parameter is _not_ given, the publish_time is now,
         and the item is immediately published.
         """
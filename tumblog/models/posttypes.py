@@ -1,13 +1,14 @@
 from django.db import models
 from tumblog.models import Post
-from autofields.fields import AutoMarkdownTextField
+from tumblog.fields import MarkdownTextField
 from django.conf import settings
-from sorl.thumbnail.fields import ImageWithThumbnailsField
+from django.utils import simplejson
+from tumblog.thumbnails import schedule_thumbnails
 
 class TextPost(Post):
     """ Text post model """
     body_raw        = models.TextField()
-    body            = AutoMarkdownTextField(prepopulate_from='body_raw')
+    body            = MarkdownTextField(prepopulate_from='body_raw')
 
     class Meta:
         app_label   = 'tumblog'
@@ -16,7 +17,7 @@ class LinkPost(Post):
     """ Link post model """
     link            = models.URLField()
     description_raw = models.TextField()
-    description     = AutoMarkdownTextField(prepopulate_from='description_raw')
+    description     = MarkdownTextField(prepopulate_from='description_raw')
 
     class Meta:
         app_label   = 'tumblog'
@@ -24,9 +25,9 @@ class LinkPost(Post):
 class QuotePost(Post):
     """ Quote post model """
     quote_raw       = models.TextField()
-    quote           = AutoMarkdownTextField(prepopulate_from='quote_raw')
+    quote           = MarkdownTextField(prepopulate_from='quote_raw')
     citation_raw    = models.CharField(max_length=255)
-    citation        = AutoMarkdownTextField(prepopulate_from='citation_raw')
+    citation        = MarkdownTextField(prepopulate_from='citation_raw')
 
     class Meta:
         app_label   = 'tumblog'
@@ -34,23 +35,88 @@ class QuotePost(Post):
 class PhotoPost(Post):
     """ Photo post model. This can contain multiple photos. """
     description_raw = models.TextField()
-    description     = AutoMarkdownTextField(prepopulate_from='description_raw')
+    description     = MarkdownTextField(prepopulate_from='description_raw')
 
     class Meta:
         app_label   = 'tumblog'
 
+    @property
+    def photo_list(self):
+        """ This post's photos, prefetched when loaded through with_photos() """
+        if not hasattr(self, '_photo_cache'):
+            self._photo_cache = list(self.photos.all())
+        return self._photo_cache
+
 class Photo(models.Model):
     """ Individual image model, used in photo posts. """
     caption_raw     = models.TextField()
-    caption         = AutoMarkdownTextField(prepopulate_from='caption_raw')
+    caption         = MarkdownTextField(prepopulate_from='caption_raw')
     source_url      = models.URLField(blank=True, null=True)
-    image           = ImageWithThumbnailsField(
-                        upload_to='photos',
-                        generate_on_save=True,
-                        thumbnail={'size': (100,100), 'extension': 'png'},
-                        extra_thumbnails={'preview': {'size': (400, 400), 'extension': 'png'}},
-                      )
+    image           = models.ImageField(upload_to='photos')
     post            = models.ForeignKey(PhotoPost, related_name='photos')
 
+    # recorded when the thumbnails are generated (see tumblog.thumbnails),
+    # so listings never have to ask the storage backend for them
+    thumbnail_path  = models.CharField(max_length=255, blank=True, editable=False)
+    thumbnail_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    thumbnail_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    preview_path    = models.CharField(max_length=255, blank=True, editable=False)
+    preview_width   = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    preview_height  = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    thumbnails      = models.TextField(blank=True, editable=False)
+
     class Meta:
         app_label   = 'tumblog'
+
+    def save(self, *args, **kwargs):
+        stored = []
+        if self.pk:
+            stored = Photo.objects.filter(pk = self.pk).values_list('image', flat = True)
+        image_changed = not stored or stored[0] != self.image.name
+
+        if image_changed:
+            # the old thumbnails are stale, use the image until the new ones exist
+            self.thumbnail_path = self.preview_path = ''
+            self.thumbnail_width = self.thumbnail_height = None
+            self.preview_width = self.preview_height = None
+            self.thumbnails = ''
+
+        super(Photo, self).save(*args, **kwargs)
+        if image_changed:
+            schedule_thumbnails(self)
+
+    @property
+    def thumbnail_url(self):
+        if self.thumbnail_path:
+            return settings.MEDIA_URL + self.thumbnail_path
+        return self.image.url
+
+    @property
+    def preview_url(self):
+        if self.preview_path:
+            return settings.MEDIA_URL + self.preview_path
+        return self.image.url
+
+    def thumbnail_set(self):
+        """
+        The generated thumbnails by preset name, each a dict of path, width,
+        height and srcset, a list of (path, width) pairs.
+        """
+        if not self.thumbnails:
+            return {}
+        return simplejson.loads(self.thumbnails)
+
+    def srcset(self, preset):
+        """ srcset attribute value for the preset, '' if not generated """
+        info = self.thumbnail_set().get(preset)
+        if not info:
+            return ''
+        return ', '.join(["%s%s %dw" % (settings.MEDIA_URL, path, width) for path, width in info['srcset']])
+
+    @property
+    def thumbnail_srcset(self):
+        return self.srcset('thumbnail')
+
+    @property
+    def preview_srcset(self):
+        return self.srcset('preview')
@@ -0,0 +1,144 @@
+from datetime import datetime
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from tagging import settings as tagging_settings
+from tagging.models import Tag
+from tagging.utils import parse_tag_input
+
+from tumblog.models import Blog
+
+def tag_names(tags):
+    """ Split a post's tags field into tag names, the way tagging does """
+    names = parse_tag_input(tags)
+    if tagging_settings.FORCE_LOWERCASE_TAGS:
+        names = [name.lower() for name in names]
+    return names
+
+def published_state(blog_id, tags, pubtime, live):
+    """
+    What a post in the given state counts toward in the summaries, as
+    (blog_id, tag names, (year, month)), or None if it isn't live.
+    """
+    if not live:
+        return None
+    return blog_id, set(tag_names(tags)), (pubtime.year, pubtime.month)
+
+def move_post(old, new):
+    """ Move a post's contribution to the summaries from state old to new """
+    if old and new and old[0] == new[0]:
+        TagCount.objects.adjust(new[0], old[1] - new[1], -1)
+        TagCount.objects.adjust(new[0], new[1] - old[1], 1)
+        if old[2] != new[2]:
+            ArchiveMonth.objects.adjust(old[0], old[2], -1)
+            ArchiveMonth.objects.adjust(new[0], new[2], 1)
+        return
+
+    if old:
+        TagCount.objects.adjust(old[0], old[1], -1)
+        ArchiveMonth.objects.adjust(old[0], old[2], -1)
+    if new:
+        TagCount.objects.adjust(new[0], new[1], 1)
+        ArchiveMonth.objects.adjust(new[0], new[2], 1)
+
+def _create(manager, **kwargs):
+    """
+    Create a row in a savepoint, returning False if it clashed with one
+    created meanwhile. The savepoint keeps the transaction usable after
+    the clash, which PostgreSQL would otherwise abort.
+    """
+    sid = transaction.savepoint()
+    try:
+        manager.create(**kwargs)
+    except IntegrityError:
+        transaction.savepoint_rollback(sid)
+        return False
+    transaction.savepoint_commit(sid)
+    return True
+
+class TagCountManager(models.Manager):
+    def adjust(self, blog_id, names, delta):
+        """ Add delta to the count of each of the named tags in the blog """
+        for name in names:
+            tag, created = Tag.objects.get_or_create(name = name)
+            updated = self.filter(blog = blog_id, tag = tag).update(count = F('count') + delta)
+            if not updated and delta > 0:
+                if not _create(self, blog_id = blog_id, tag = tag, count = delta):
+                    # somebody else created it meanwhile
+                    self.filter(blog = blog_id, tag = tag).update(count = F('count') + delta)
+
+    @transaction.commit_on_success
+    def rebuild(self, blog):
+        """ Recount the tags of all the blog's published posts """
+        counts = {}
+        for tags in blog.posts.values_list('tags', flat = True):
+            for name in tag_names(tags):
+                counts[name] = counts.get(name, 0) + 1
+
+        self.filter(blog = blog).delete()
+        for name, count in counts.items():
+            tag, created = Tag.objects.get_or_create(name = name)
+            self.create(blog = blog, tag = tag, count = count)
+
+class TagCount(models.Model):
+    """
+    Number of published posts in a blog using a tag. Kept up to date by
+    tumblog.listeners, and rebuilt with the rebuild_summaries command.
+    """
+    blog            = models.ForeignKey(Blog, related_name = 'tag_counts')
+    tag             = models.ForeignKey(Tag)
+    count           = models.PositiveIntegerField(default = 0)
+
+    objects         = TagCountManager()
+
+    class Meta:
+        app_label   = 'tumblog'
+        ordering    = ('-count',)
+        unique_together = (('blog', 'tag'),)
+
+    def __unicode__(self):
+        return "%s: %s (%d)" % (self.blog, self.tag, self.count)
+
+class ArchiveMonthManager(models.Manager):
+    def adjust(self, blog_id, year_month, delta):
+        """ Add delta to the blog's post count for the (year, month) """
+        year, month = year_month
+        posts = self.filter(blog = blog_id, year = year, month = month)
+        if not posts.update(post_count = F('post_count') + delta) and delta > 0:
+            if not _create(self, blog_id = blog_id, year = year, month = month, post_count = delta):
+                posts.update(post_count = F('post_count') + delta)
+
+    @transaction.commit_on_success
+    def rebuild(self, blog):
+        """ Recount the blog's published posts per month """
+        counts = {}
+        for pubtime in blog.posts.values_list('pubtime', flat = True):
+            month = (pubtime.year, pubtime.month)
+            counts[month] = counts.get(month, 0) + 1
+
+        self.filter(blog = blog).delete()
+        for (year, month), count in counts.items():
+            self.create(blog = blog, year = year, month = month, post_count = count)
+
+class ArchiveMonth(models.Model):
+    """
+    Number of published posts in a blog per month, the blog's archive
+    index. Maintained alongside TagCount.
+    """
+    blog            = models.ForeignKey(Blog, related_name = 'month_counts')
+    year            = models.PositiveSmallIntegerField()
+    month           = models.PositiveSmallIntegerField()
+    post_count      = models.PositiveIntegerField(default = 0)
+
+    objects         = ArchiveMonthManager()
+
+    class Meta:
+        app_label   = 'tumblog'
+        ordering    = ('-year', '-month')
+        unique_together = (('blog', 'year', 'month'),)
+
+    def __unicode__(self):
+        return "%s: %d/%d (%d)" % (self.blog, self.year, self.month, self.post_count)
+
+    @property
+    def date(self):
+        return datetime(self.year, self.month, 1)
@@ -0,0 +1,69 @@
+"""
+Rendering of individual posts through their per-type templates, with the
+rendered fragments cached. Cache keys include the post's and the blog's
+modtime, so any change to either (or to a photo, which touches its post)
+moves on to a fresh key; stale fragments just age out.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template import loader, Context
+
+from tumblog.caching import stamp
+
+POST_CACHE_TIMEOUT = getattr(settings, 'TUMBLOG_POST_CACHE_TIMEOUT', 60 * 60 * 24)
+CACHE_TEMPLATES = getattr(settings, 'TUMBLOG_CACHE_TEMPLATES', not settings.DEBUG)
+
+# compiled post type templates, by template name
+_templates = {}
+
+def post_cache_key(blog, post, autoescape=True):
+    return "tumblog.post.%d.%s.%s.%s.%d" % (post.pk, stamp(post.modtime),
+            stamp(blog.modtime), post.template_name, bool(autoescape))
+
+def prime_post_cache(blog, posts, autoescape=True):
+    """
+    Fetch the cached fragments for a whole page of posts in one go, so
+    render_post() doesn't have to go to the cache once per post.
+    """
+    if not POST_CACHE_TIMEOUT:
+        return posts
+
+    keys = dict((post_cache_key(blog, post, autoescape), post) for post in posts)
+    found = cache.get_many(keys.keys())
+    for key, post in keys.items():
+        post._rendered = (key, found.get(key))
+    return posts
+
+def render_post(blog, post, autoescape=True):
+    """ Render the post with its post type's template """
+    if not POST_CACHE_TIMEOUT:
+        return _render_post(blog, post, autoescape)
+
+    key = post_cache_key(blog, post, autoescape)
+    primed_key, html = getattr(post, '_rendered', (None, None))
+    if primed_key != key:
+        html = cache.get(key)
+
+    if html is None:
+        html = _render_post(blog, post, autoescape)
+        cache.set(key, html, POST_CACHE_TIMEOUT)
+    return html
+
+def get_post_template(template_name):
+    """
+    The compiled template for a post type. Templates are loaded and parsed
+    once per process, unless TUMBLOG_CACHE_TEMPLATES is off (it defaults
+    to off when DEBUG is on, so template edits show up in development).
+    """
+    if not CACHE_TEMPLATES:
+        return loader.get_template(template_name)
+
+    try:
+        return _templates[template_name]
+    except KeyError:
+        t = _templates[template_name] = loader.get_template(template_name)
+        return t
+
+def _render_post(blog, post, autoescape=True):
+    t = get_post_template(post.template_name)
+    return t.nodelist.render(Context({'blog': blog, 'post': post}, autoescape=autoescape))
@@ -0,0 +1,65 @@
+"""
+Scheduled publishing. Only live posts are published: they alone show up in
+Post.published, Blog.posts and the summaries. Saving a post puts it live if
+its pubtime has passed; otherwise a 'publish' job is queued for its pubtime,
+and when the job comes due (the publish_scheduled or run_jobs command)
+go_live() does what the listeners do for a post saved live: count it in the
+summaries, drop the blog's cached state and refresh its feeds.
+"""
+from datetime import datetime
+from django.db import transaction
+
+from tumblog.models import Blog, Post
+from tumblog.models.summaries import published_state, move_post
+from tumblog.caching import invalidate_blog
+from tumblog.feeds import PRECOMPUTE_FEEDS, refresh_feeds
+from tumblog.tasks import enqueue
+
+def schedule(post):
+    """ Queue a post that isn't live to go live at its pubtime """
+    enqueue('publish', post, run_at = post.pubtime)
+
+@transaction.commit_on_success
+def _go_live(posts, now):
+    flipped = {}
+    for post in posts:
+        if post.pubtime is None:
+            continue
+        if post.pubtime > now:
+            # moved on since it was queued
+            schedule(post)
+            continue
+
+        # whoever flips the flag gets to count the post
+        if Post.objects.filter(pk = post.pk, live = False).update(live = True, modtime = now):
+            state = published_state(post.blog_id, post.tags, post.pubtime, True)
+            move_post(None, state)
+            flipped.setdefault(post.blog_id, []).append(state[1])
+    return flipped
+
+def go_live(posts):
+    """ Put the posts whose pubtime has passed live. Returns how many went live. """
+    flipped = _go_live(posts, datetime.now())
+
+    # once committed, or a request could cache the old state again
+    for blog in Blog.objects.filter(pk__in = flipped.keys()):
+        invalidate_blog(blog.slug)
+        if PRECOMPUTE_FEEDS:
+            refresh_feeds(blog, set([name for names in flipped[blog.pk] for name in names]))
+    return sum([len(states) for states in flipped.values()])
+
+def resync(blog):
+    """
+    Bring the live flags of the blog's posts in line with their pubtimes,
+    and queue the scheduled ones, after changes made behind the listeners'
+    back. The summaries need rebuilding afterwards.
+    """
+    # not blog.post_set, whose default manager only sees live posts
+    posts = Post.objects.filter(blog = blog)
+    now = datetime.now()
+    posts.filter(live = False, pubtime__lte = now).update(live = True)
+    posts.filter(live = True, pubtime__gt = now).update(live = False)
+    posts.filter(live = True, pubtime__isnull = True).update(live = False)
+    for post in posts.filter(pubtime__gt = now):
+        schedule(post)
+    invalidate_blog(blog.slug)
@@ -0,0 +1 @@
+CREATE INDEX tumblog_post_blog_live_pubtime ON tumblog_post (blog_id, live, pubtime);
@@ -0,0 +1 @@
+CREATE INDEX tumblog_tagcount_blog_count ON tumblog_tagcount (blog_id, count);
@@ -0,0 +1,96 @@
+"""
+A small database backed job queue. Tasks are functions taking a model and
+a list of its instances, registered under a name; enqueue() records an
+object for a task, optionally not to run before a given time, and
+run_queued() (the run_jobs command) works through the jobs that are due, a
+batch of objects of one type at a time. A batch whose task fails is logged
+and queued again, to be retried after TUMBLOG_JOB_RETRY_DELAY seconds.
+"""
+import logging
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from tumblog.models import QueuedJob
+
+RETRY_DELAY = getattr(settings, 'TUMBLOG_JOB_RETRY_DELAY', 5 * 60)
+
+_tasks = {}
+
+def task(name):
+    """ Decorator registering a task function under the name """
+    def register(func):
+        _tasks[name] = func
+        return func
+    return register
+
+def enqueue(name, instance, run_at=None):
+    """ Queue the instance for the task, to run once run_at (if given) has passed """
+    content_type = ContentType.objects.get_for_model(type(instance))
+    lookup = dict(task = name, content_type = content_type, object_id = instance.pk)
+    try:
+        job, created = QueuedJob.objects.get_or_create(defaults = {'run_at': run_at}, **lookup)
+    except IntegrityError:
+        # already queued by somebody else
+        created = False
+    if not created:
+        QueuedJob.objects.filter(**lookup).update(run_at = run_at)
+
+def _retry(name, content_type, batch):
+    """ Queue the jobs of a failed batch again, unless queued afresh meanwhile """
+    run_at = datetime.now() + timedelta(seconds = RETRY_DELAY)
+    for job in batch:
+        QueuedJob.objects.get_or_create(task = name, content_type = content_type,
+                object_id = job.object_id, defaults = {'run_at': run_at})
+
+def run_queued(batch_size=100, processes=None, tasks=None):
+    """
+    Run the queued jobs that are due, oldest first, only those of the
+    named tasks if given. Returns the number run successfully.
+    """
+    done = 0
+    while True:
+        jobs = QueuedJob.objects.filter(Q(run_at__isnull = True) | Q(run_at__lte = datetime.now()))
+        if tasks is not None:
+            jobs = jobs.filter(task__in = tasks)
+        jobs = list(jobs[:batch_size])
+        if not jobs:
+            return done
+
+        batches = {}
+        for job in jobs:
+            batches.setdefault((job.task, job.content_type_id), []).append(job)
+
+        for (name, content_type_id), batch in batches.items():
+            # dequeue first, so objects saved meanwhile get queued afresh
+            QueuedJob.objects.filter(pk__in = [job.pk for job in batch]).delete()
+            content_type = ContentType.objects.get_for_id(content_type_id)
+            model = content_type.model_class()
+            try:
+                # not _default_manager, which for Post only sees live posts
+                objects = model._base_manager.in_bulk([job.object_id for job in batch]).values()
+                if objects:
+                    _tasks[name](model, objects, processes)
+            except Exception:
+                logging.exception("tumblog task %s failed for %d %s objects" % (name, len(batch), model.__name__))
+                transaction.rollback_unless_managed()
+                _retry(name, content_type, batch)
+                continue
+            done += len(batch)
+
+@task('markdown')
+def render_markdown(model, objects, processes=None):
+    from tumblog.markup import render_objects
+    render_objects(model, objects, processes)
+
+@task('thumbnails')
+def generate_thumbnails(model, objects, processes=None):
+    from tumblog.thumbnails import generate_thumbnails
+    generate_thumbnails(objects, processes)
+
+@task('publish')
+def publish_posts(model, objects, processes=None):
+    from tumblog.scheduler import go_live
+    go_live(objects)
@@ -1,5 +1,5 @@
 from django import template
-from django.template import loader, Context
+from tumblog.rendering import render_post
 
 register = template.Library()
 
@@ -19,7 +19,6 @@ class DoPostNode(template.Node):
     def render(self, context):
         blog = self.blog.resolve(context)
         post = self.post.resolve(context)
-        t = loader.get_template(post.template_name)
-        return t.nodelist.render(Context({'blog': blog, 'post': post}, autoescape=context.autoescape))
+        return render_post(blog, post, context.autoescape)
 
 register.tag('post', do_post)
@@ -5,8 +5,18 @@ unittest). These will both pass when you run "manage.py test".
 Replace these with more appropriate tests for your application.
 """
 
+import threading
+from datetime import datetime, timedelta
+from django.core import signals
 from django.test import TestCase
 
+from tumblog.caching import blog_state
+from tumblog.models import Blog, Post, TextPost, QueuedJob, TagCount, ArchiveMonth
+from tumblog.scheduler import resync
+from tumblog.tasks import enqueue, run_queued, task
+from tumblog.thumbnails import thumbnail_path
+from tumblog.workers import defer
+
 class SimpleTest(TestCase):
     def test_basic_addition(self):
         """
@@ -14,6 +24,47 @@ class SimpleTest(TestCase):
         """
         self.failUnlessEqual(1 + 1, 2)
 
+class ResyncTest(TestCase):
+    def test_resync(self):
+        """
+        Tests that resync puts posts whose pubtime has passed live, and
+        queues the scheduled ones, as after adding the live column.
+        """
+        blog = Blog.objects.create(slug = 'test', title = 'Test', description_raw = '')
+        past = TextPost(blog = blog, title = 'Past', body_raw = '')
+        past.publish(datetime.now() - timedelta(days = 1))
+        future = TextPost(blog = blog, title = 'Future', body_raw = '')
+        future.publish(datetime.now() + timedelta(days = 1))
+        Post.objects.update(live = False)
+        QueuedJob.objects.all().delete()
+
+        resync(blog)
+
+        self.failUnless(Post.objects.get(pk = past.pk).live)
+        self.failIf(Post.objects.get(pk = future.pk).live)
+        self.failUnlessEqual(QueuedJob.objects.filter(task = 'publish', object_id = future.pk).count(), 1)
+
+    def test_resync_publishes(self):
+        """
+        Tests that a post queued by resync goes live, and is counted,
+        once its pubtime has passed.
+        """
+        blog = Blog.objects.create(slug = 'test', title = 'Test', description_raw = '')
+        post = TextPost(blog = blog, title = 'Later', tags = 'later', body_raw = '')
+        post.publish(datetime.now() + timedelta(days = 1))
+        QueuedJob.objects.all().delete()
+        resync(blog)
+
+        pubtime = datetime.now() - timedelta(minutes = 1)
+        Post.objects.filter(pk = post.pk).update(pubtime = pubtime)
+        QueuedJob.objects.update(run_at = pubtime)
+        run_queued(tasks = ['publish'])
+
+        self.failUnless(Post.objects.get(pk = post.pk).live)
+        self.failUnlessEqual(TagCount.objects.get(blog = blog, tag__name = 'later').count, 1)
+        self.failUnlessEqual(ArchiveMonth.objects.get(blog = blog, year = pubtime.year,
+                month = pubtime.month).post_count, 1)
+
 __test__ = {"doctest": """
 Another way to test that 1 + 1 is equal to 2.
 
@@ -21,3 +72,62 @@ Another way to test that 1 + 1 is equal to 2.
 True
 """}
 
+class ThumbnailPathTest(TestCase):
+    def test_extension_kept(self):
+        """
+        Tests that images differing only in their extension get thumbnails
+        of their own.
+        """
+        jpg = thumbnail_path('photos/cat.jpg', 'thumbnail', 'JPEG')
+        png = thumbnail_path('photos/cat.png', 'thumbnail', 'JPEG')
+        self.failIfEqual(jpg, png)
+        self.failUnlessEqual(jpg, 'photos/thumbs/cat_jpg_thumbnail.jpg')
+        self.failUnlessEqual(thumbnail_path('photos/cat.png', 'preview', 'PNG', 2),
+                'photos/thumbs/cat_png_preview_2x.png')
+
+class BlogStateTest(TestCase):
+    def test_delete_moves_state(self):
+        """
+        Tests that deleting a post moves the blog's last modified time on,
+        even though the deleted post was the latest change.
+        """
+        blog = Blog.objects.create(slug = 'test', title = 'Test', description_raw = '')
+        post = TextPost(blog = blog, title = 'Gone', body_raw = '')
+        post.publish()
+        before = blog_state('test')['last_modified']
+
+        post.delete()
+        self.failUnless(blog_state('test')['last_modified'] > before)
+
+@task('test.fail')
+def fail(model, objects, processes=None):
+    raise ValueError("failing on purpose")
+
+class RunQueuedTest(TestCase):
+    def test_failed_batch_requeued(self):
+        """
+        Tests that the jobs of a batch whose task fails are queued again
+        for later, instead of being lost.
+        """
+        blog = Blog.objects.create(slug = 'test', title = 'Test', description_raw = '')
+        enqueue('test.fail', blog)
+
+        self.failUnlessEqual(run_queued(tasks = ['test.fail']), 0)
+        job = QueuedJob.objects.get(task = 'test.fail', object_id = blog.pk)
+        self.failUnless(job.run_at > datetime.now())
+
+class DeferTest(TestCase):
+    def test_after_request(self):
+        """
+        Tests that calls deferred during a request only run once the
+        request is finished.
+        """
+        done = threading.Event()
+        signals.request_started.send(sender = self.__class__)
+        defer(done.set)
+        done.wait(0.2)
+        self.failIf(done.isSet())
+
+        signals.request_finished.send(sender = self.__class__)
+        done.wait(5)
+        self.failUnless(done.isSet())
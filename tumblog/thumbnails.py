@@ -0,0 +1,168 @@
+"""
+Photo thumbnails, generated off the request. Saving a photo with a new
+image queues it for the run_jobs command (or, with
+TUMBLOG_THUMBNAILS_IN_THREAD on, hands it to a background thread once
+the request is finished and the photo committed), and
+the thumbnails are made in a pool of worker processes. Until then the
+photo's thumbnail_url and preview_url point at the original image.
+
+Thumbnails are made per preset, configured in TUMBLOG_THUMBNAIL_PRESETS
+as a sequence of (name, options) pairs. Options are 'size' (bounding box),
+'format' ('JPEG', 'PNG' or 'WEBP', if PIL supports it), 'quality',
+'progressive' and 'scales', the multiples of size to make for srcset.
+The 'thumbnail' and 'preview' presets are also recorded in the
+Photo.thumbnail_* and preview_* columns.
+"""
+import os
+from django.conf import settings
+from django.utils import simplejson
+try:
+    from PIL import Image, ImageFile
+except ImportError:
+    import Image, ImageFile
+
+from tumblog.workers import parallel_map, defer
+
+THUMBNAILS_IN_THREAD = getattr(settings, 'TUMBLOG_THUMBNAILS_IN_THREAD', False)
+THUMBNAIL_DIR = 'photos/thumbs'
+
+PRESET_DEFAULTS = {
+    'format': 'JPEG',
+    'quality': 85,
+    'progressive': True,
+    'scales': (1, 2),
+}
+
+THUMBNAIL_PRESETS = [(name, dict(PRESET_DEFAULTS, **options)) for name, options in
+    getattr(settings, 'TUMBLOG_THUMBNAIL_PRESETS', (
+        ('thumbnail', {'size': (100, 100)}),
+        ('preview', {'size': (400, 400)}),
+    ))]
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+def thumbnail_path(image_name, preset, format, scale=1):
+    """ Path of a thumbnail, relative to MEDIA_ROOT """
+    # keep the image's extension, or cat.jpg and cat.png would share thumbnails
+    base, ext = os.path.splitext(os.path.basename(image_name))
+    base += ext.replace('.', '_')
+    suffix = scale != 1 and '_%dx' % scale or ''
+    return '%s/%s_%s%s.%s' % (THUMBNAIL_DIR, base, preset, suffix,
+            EXTENSIONS.get(format, format.lower()))
+
+def make_thumbnail(job):
+    """
+    Worker process side: scale source down into dest, returning the
+    resulting (width, height, bytes), or None if the source can't be read.
+    """
+    source, dest, size, format, options = job
+    try:
+        image = Image.open(source)
+    except IOError:
+        return None
+
+    if format == 'PNG':
+        if image.mode not in ('RGB', 'RGBA', 'L', 'P'):
+            image = image.convert('RGBA')
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail(size, Image.ANTIALIAS)
+
+    if not os.path.isdir(os.path.dirname(dest)):
+        os.makedirs(os.path.dirname(dest))
+
+    # progressive JPEGs need the whole image in one encoder block
+    ImageFile.MAXBLOCK = max(ImageFile.MAXBLOCK, image.size[0] * image.size[1] * 4)
+    image.save(dest, format, optimize = True, **options)
+    return image.size + (os.path.getsize(dest),)
+
+def _stored_paths(photo):
+    paths = set([photo.thumbnail_path, photo.preview_path])
+    for info in photo.thumbnail_set().values():
+        paths.update([path for path, width in info['srcset']])
+    paths.discard('')
+    return paths
+
+def thumbnail_bytes(photos):
+    """ Bytes currently on disk for the photos' thumbnails, per preset """
+    totals = {}
+    for photo in photos:
+        infos = photo.thumbnail_set()
+        for name in ('thumbnail', 'preview'):
+            path = getattr(photo, '%s_path' % name)
+            if name not in infos and path:
+                infos[name] = {'srcset': [(path, None)]}
+
+        for name, info in infos.items():
+            for path, width in info['srcset']:
+                path = os.path.join(settings.MEDIA_ROOT, path)
+                if os.path.exists(path):
+                    totals[name] = totals.get(name, 0) + os.path.getsize(path)
+    return totals
+
+def generate_thumbnails(photos, processes=None):
+    """
+    Make the thumbnails of the photos for every preset, and record them on
+    their rows. Returns the bytes written per preset.
+    """
+    from tumblog.models import Photo
+    from tumblog.listeners import touch
+
+    photos = list(photos)
+    jobs = []
+    for photo in photos:
+        for name, preset in THUMBNAIL_PRESETS:
+            options = {'quality': preset['quality'], 'progressive': preset['progressive']}
+            for scale in preset['scales']:
+                size = (preset['size'][0] * scale, preset['size'][1] * scale)
+                dest = thumbnail_path(photo.image.name, name, preset['format'], scale)
+                jobs.append((photo.image.path, os.path.join(settings.MEDIA_ROOT, dest),
+                        size, preset['format'], options))
+    results = iter(parallel_map(make_thumbnail, jobs, processes))
+
+    totals = {}
+    for photo in photos:
+        stale = _stored_paths(photo)
+        infos = {}
+        for name, preset in THUMBNAIL_PRESETS:
+            srcset = []
+            for scale in preset['scales']:
+                made = results.next()
+                if made is None:
+                    continue
+                path = thumbnail_path(photo.image.name, name, preset['format'], scale)
+                srcset.append((path, made[0]))
+                totals[name] = totals.get(name, 0) + made[2]
+                if scale == 1:
+                    infos[name] = {'path': path, 'width': made[0], 'height': made[1]}
+            if name in infos:
+                infos[name]['srcset'] = srcset
+
+        if not infos:
+            continue
+
+        values = {'thumbnails': simplejson.dumps(infos)}
+        for name in ('thumbnail', 'preview'):
+            if name in infos:
+                values['%s_path' % name] = infos[name]['path']
+                values['%s_width' % name] = infos[name]['width']
+                values['%s_height' % name] = infos[name]['height']
+        Photo.objects.filter(pk = photo.pk).update(**values)
+        touch(photo)
+
+        # thumbnails of presets or formats no longer in use
+        for info in infos.values():
+            stale.difference_update([path for path, width in info['srcset']])
+        for path in stale:
+            path = os.path.join(settings.MEDIA_ROOT, path)
+            if os.path.exists(path):
+                os.remove(path)
+
+    return totals
+
+def schedule_thumbnails(photo):
+    if THUMBNAILS_IN_THREAD:
+        defer(generate_thumbnails, [photo], 1)
+    else:
+        from tumblog.tasks import enqueue
+        enqueue('thumbnails', photo)
@@ -0,0 +1,230 @@
+"""
+Bulk creation and update of LinkPosts, for importing bookmarks. Rows are
+inserted in batches with executemany, and updated with queryset updates,
+rather than saved one by one, so no model save signals fire; the
+summaries, schedule and caches the listeners would otherwise maintain are
+brought up to date once per import instead.
+"""
+from datetime import datetime
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction, IntegrityError
+from django.db.models import AutoField
+from django.template.defaultfilters import slugify
+from tagging.models import Tag, TaggedItem
+
+from tumblog.caching import invalidate_blog
+from tumblog.feeds import PRECOMPUTE_FEEDS, refresh_feeds
+from tumblog.markup import render_many
+from tumblog.models import Blog, Post, LinkPost, TagCount, ArchiveMonth
+from tumblog.models.summaries import published_state, tag_names
+from tumblog.scheduler import schedule
+
+BATCH_SIZE = 500
+# times an import picks slugs before giving up on clashes with concurrent imports
+SLUG_ATTEMPTS = 3
+
+def insert_objects(model, objects):
+    """ INSERT the model's own columns of the objects, in one executemany """
+    qn = connection.ops.quote_name
+    fields = [f for f in model._meta.local_fields if not isinstance(f, AutoField)]
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (qn(model._meta.db_table),
+            ", ".join([qn(f.column) for f in fields]), ", ".join(["%s"] * len(fields)))
+    rows = [[f.get_db_prep_save(getattr(obj, f.attname)) for f in fields] for obj in objects]
+    connection.cursor().executemany(sql, rows)
+
+def unique_slugs(titles):
+    """
+    Slugs for the titles, unique among themselves and against the
+    existing posts, with one query per round of collisions.
+    """
+    max_length = Post._meta.get_field('slug').max_length
+    bases = [slugify(title)[:max_length - 6] or 'link' for title in titles]
+    slugs = list(bases)
+    suffixes = [1] * len(slugs)
+
+    # slugs are accepted once they're neither in the database nor taken by
+    # an earlier title; renamed ones go round again
+    accepted = set()
+    pending = range(len(slugs))
+    while pending:
+        taken = set(Post.objects.filter(slug__in = [slugs[i] for i in pending]).values_list('slug', flat = True))
+        clashing = []
+        for i in pending:
+            if slugs[i] in taken or slugs[i] in accepted:
+                suffixes[i] += 1
+                slugs[i] = "%s-%d" % (bases[i], suffixes[i])
+                clashing.append(i)
+            else:
+                accepted.add(slugs[i])
+        pending = clashing
+    return slugs
+
+def _tag_ids(names):
+    """ Tag ids by name, creating the missing tags """
+    ids = dict(Tag.objects.filter(name__in = names).values_list('name', 'id'))
+    for name in names:
+        if name not in ids:
+            # get_or_create, as another import may be adding the tag too
+            ids[name] = Tag.objects.get_or_create(name = name)[0].pk
+    return ids
+
+def _insert_posts(links):
+    """
+    INSERT the Post rows of the links, picking their slugs again if
+    another import took some of them since they were picked.
+    """
+    for attempt in range(SLUG_ATTEMPTS):
+        # a savepoint, so the failed insert doesn't abort the whole import
+        sid = transaction.savepoint()
+        try:
+            insert_objects(Post, links)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            if attempt == SLUG_ATTEMPTS - 1:
+                raise
+            for link, slug in zip(links, unique_slugs([link.title for link in links])):
+                link.slug = slug
+        else:
+            transaction.savepoint_commit(sid)
+            return
+
+def _create_batch(blog, bookmarks):
+    now = datetime.now()
+    post_type = ContentType.objects.get_for_model(LinkPost)
+    slugs = unique_slugs([b['title'] for b in bookmarks])
+    descriptions = render_many([b['description_raw'] or '' for b in bookmarks])
+
+    links = []
+    for bookmark, slug, description in zip(bookmarks, slugs, descriptions):
+        live = bookmark['pubtime'] is not None and bookmark['pubtime'] <= now
+        links.append(LinkPost(blog_id = blog.pk, post_type_id = post_type.pk, slug = slug,
+                modtime = now, live = live, description = description, **bookmark))
+
+    _insert_posts(links)
+    ids = dict(Post.objects.filter(slug__in = [link.slug for link in links]).values_list('slug', 'id'))
+    for link in links:
+        link.id = link.post_ptr_id = ids[link.slug]
+    insert_objects(LinkPost, links)
+    _tag_links(links, post_type)
+    return links
+
+def _tag_links(links, post_type):
+    """ Tag the links, as TagField would have done on save """
+    names = dict((link.pk, tag_names(link.tags)) for link in links)
+    tag_ids = _tag_ids(list(set([name for link_names in names.values() for name in link_names])))
+    tagged = [TaggedItem(tag_id = tag_ids[name], content_type = post_type, object_id = pk)
+            for pk, link_names in names.items() for name in link_names]
+    if tagged:
+        insert_objects(TaggedItem, tagged)
+
+def _update_summaries(blog, links):
+    """ What the listeners would have done for each link, done in bulk """
+    tag_deltas = {}
+    month_deltas = {}
+    for link in links:
+        state = published_state(link.blog_id, link.tags, link.pubtime, link.live)
+        if state is None:
+            if link.pubtime is not None:
+                schedule(link)
+            continue
+        for name in state[1]:
+            tag_deltas[name] = tag_deltas.get(name, 0) + 1
+        month_deltas[state[2]] = month_deltas.get(state[2], 0) + 1
+
+    for name, delta in tag_deltas.items():
+        TagCount.objects.adjust(blog.pk, [name], delta)
+    for month, delta in month_deltas.items():
+        ArchiveMonth.objects.adjust(blog.pk, month, delta)
+    return tag_deltas.keys()
+
+@transaction.commit_on_success
+def _import_links(blog, bookmarks, on_created):
+    links = []
+    for start in xrange(0, len(bookmarks), BATCH_SIZE):
+        links.extend(_create_batch(blog, bookmarks[start:start + BATCH_SIZE]))
+
+    tags = _update_summaries(blog, links)
+    if on_created is not None:
+        on_created(links)
+    return links, tags
+
+def _update_batch(links, bookmarks, tag_deltas, month_deltas):
+    """ Apply the bookmarks to their links, adding up the summary deltas """
+    now = datetime.now()
+    post_type = ContentType.objects.get_for_model(LinkPost)
+    descriptions = render_many([b['description_raw'] or '' for b in bookmarks])
+
+    for link, bookmark, description in zip(links, bookmarks, descriptions):
+        old = published_state(link.blog_id, link.tags, link.pubtime, link.live)
+        for name, value in bookmark.items():
+            setattr(link, name, value)
+        link.description = description
+        link.live = link.pubtime is not None and link.pubtime <= now
+        new = published_state(link.blog_id, link.tags, link.pubtime, link.live)
+
+        Post.objects.filter(pk = link.pk).update(title = link.title, tags = link.tags,
+                pubtime = link.pubtime, live = link.live, modtime = now)
+        LinkPost.objects.filter(pk = link.pk).update(link = link.link,
+                description_raw = link.description_raw, description = description)
+
+        # a tag the link keeps nets out to 0, but its feed changed all the same
+        for state, delta in ((old, -1), (new, 1)):
+            if state is None:
+                continue
+            for name in state[1]:
+                tag_deltas[name] = tag_deltas.get(name, 0) + delta
+            month_deltas[state[2]] = month_deltas.get(state[2], 0) + delta
+        if new is None and link.pubtime is not None:
+            schedule(link)
+
+    TaggedItem.objects.filter(content_type = post_type,
+            object_id__in = [link.pk for link in links]).delete()
+    _tag_links(links, post_type)
+
+@transaction.commit_on_success
+def _reimport_links(blog, links, bookmarks, on_updated):
+    tag_deltas = {}
+    month_deltas = {}
+    for start in xrange(0, len(links), BATCH_SIZE):
+        _update_batch(links[start:start + BATCH_SIZE], bookmarks[start:start + BATCH_SIZE],
+                tag_deltas, month_deltas)
+
+    for name, delta in tag_deltas.items():
+        if delta:
+            TagCount.objects.adjust(blog.pk, [name], delta)
+    for month, delta in month_deltas.items():
+        if delta:
+            ArchiveMonth.objects.adjust(blog.pk, month, delta)
+    if on_updated is not None:
+        on_updated(links)
+    return tag_deltas.keys()
+
+def reimport_links(blog, links, bookmarks, on_updated=None):
+    """
+    Bring existing LinkPosts of the blog in line with their bookmarks,
+    dicts of field values as for import_links, in one transaction and
+    without saving them one by one. on_updated, if given, is called with
+    the links inside the transaction.
+    """
+    if not links:
+        return
+    tags = _reimport_links(blog, links, bookmarks, on_updated)
+
+    invalidate_blog(blog.slug)
+    if PRECOMPUTE_FEEDS:
+        refresh_feeds(blog, tags)
+
+def import_links(blog, bookmarks, on_created=None):
+    """
+    Create a LinkPost for each bookmark, a dict of LinkPost field values
+    (title, link, description_raw, tags, pubtime), in one transaction.
+    on_created, if given, is called with the links inside the transaction.
+    Returns the created links, in the order of the bookmarks.
+    """
+    links, tags = _import_links(blog, bookmarks, on_created)
+
+    # only once committed, or a request could cache the old state again
+    invalidate_blog(blog.slug)
+    if PRECOMPUTE_FEEDS and links:
+        refresh_feeds(blog, tags)
+    return links
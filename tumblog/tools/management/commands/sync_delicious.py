@@ -0,0 +1,23 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+
+from tumblog.tools.sync import sync_all
+
+class Command(NoArgsCommand):
+    help = "Sync the bookmarks of every delicious updater into its blog."
+    option_list = NoArgsCommand.option_list + (
+        make_option('--threads', type = 'int', dest = 'threads',
+            help = 'Accounts to sync at once, defaults to TUMBLOG_DELICIOUS_SYNC_THREADS.'),
+        make_option('--timeout', type = 'int', dest = 'timeout', metavar = 'SECONDS',
+            help = 'Give up on an account after SECONDS.'),
+    )
+
+    def handle_noargs(self, **options):
+        results = sync_all(threads = options.get('threads'), timeout = options.get('timeout'))
+
+        if int(options.get('verbosity', 1)) > 0:
+            for result in results:
+                print unicode(result).encode('utf-8')
+            failed = len([r for r in results if r.error])
+            print "Synced %d items for %d updaters, %d failed" % (
+                    sum([r.items for r in results]), len(results), failed)
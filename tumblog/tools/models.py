@@ -1,11 +1,38 @@
+from django.conf import settings
 from django.db import models
-from pydelicious import DeliciousAPI, ISO_8601_DATETIME
+import pydelicious
+from pydelicious import DeliciousAPI, ISO_8601_DATETIME, HTTP_POOL, DLCS_POOL_SIZE, DLCS_CACHE_SIZE, ResponseCache
 from time import gmtime as epoch_to_utc
 from calendar import timegm as utc_to_epoch
 from time import strptime, strftime
 from datetime import datetime
+import time
 
 from tumblog.models import *
+from tumblog.tools.importer import import_links, reimport_links, insert_objects
+
+# hashes per posts_get request when syncing
+SYNC_BATCH_SIZE = getattr(settings, 'TUMBLOG_DELICIOUS_SYNC_BATCH_SIZE', 100)
+# idle keep-alive connections kept per host, shared by all accounts
+HTTP_POOL.size = getattr(settings, 'TUMBLOG_DELICIOUS_POOL_SIZE', DLCS_POOL_SIZE)
+# on-disk cache of the RSS and json feeds, revalidated with conditional requests
+if getattr(settings, 'TUMBLOG_DELICIOUS_FEED_CACHE_DIR', None):
+    pydelicious.FEED_CACHE = ResponseCache(settings.TUMBLOG_DELICIOUS_FEED_CACHE_DIR,
+            getattr(settings, 'TUMBLOG_DELICIOUS_FEED_CACHE_SIZE', DLCS_CACHE_SIZE))
+
+def batches(items, size):
+    """ Lists of up to size of the items, consuming them as it goes """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class SyncTimeout(Exception):
+    pass
 
 class DeliciousUpdater(models.Model):
     blog = models.ForeignKey(Blog)
@@ -27,27 +54,111 @@ class DeliciousUpdater(models.Model):
         t = strptime(timestr, ISO_8601_DATETIME)
         return datetime(*(t[0:6]))
 
-    def update_links(self):
+    def _bookmark(self, p):
+        """ LinkPost field values for a post from the API """
+        return {
+            'title': p['description'],
+            'link': p['href'],
+            'description_raw': p.get('extended', ''),
+            'tags': p['tag'],
+            'pubtime': self._parse_datetime(p['time']),
+        }
+
+    def _changed_hashes(self, api):
+        """ url hashes of the bookmarks that are new or changed since the last sync """
+        manifest = api.posts_all(hashes = True, stream = True)['posts']
+        known = dict(self.synced_posts.values_list('url_hash', 'meta_hash'))
+        return [p['url'] for p in manifest if known.get(p['url']) != p['meta']]
+
+    def _changed_posts(self, api):
+        """
+        Batches of the bookmarks that are new or changed since the last
+        sync. The first sync streams them all in one request, later ones
+        fetch what the hash manifest says changed.
+        """
+        if not self.synced_posts.all()[:1]:
+            for batch in batches(api.posts_all(meta = True, stream = True)['posts'], SYNC_BATCH_SIZE):
+                yield batch
+            return
+
+        changed = self._changed_hashes(api)
+        for start in xrange(0, len(changed), SYNC_BATCH_SIZE):
+            yield api.posts_get(hashes = changed[start:start + SYNC_BATCH_SIZE], meta = True)['posts']
 
-        api = DeliciousAPI(self.username, self.password)
+    def _update_synced(self, posts):
+        """ Bring the links of bookmarks synced before up to date """
+        synced = self.synced_posts.select_related('link').filter(url_hash__in = [p['hash'] for p in posts])
+        synced = dict((s.url_hash, s) for s in synced)
+        def record(links):
+            for p in posts:
+                DeliciousPost.objects.filter(pk = synced[p['hash']].pk).update(meta_hash = p['meta'])
+        reimport_links(self.blog, [synced[p['hash']].link for p in posts],
+                [self._bookmark(p) for p in posts], on_updated = record)
+
+    def _adopt_links(self, posts):
+        """
+        Record existing links for bookmarks not synced by hash before, eg.
+        imported by an older version, rather than creating duplicates.
+        """
+        existing = LinkPost.objects.filter(blog = self.blog, link__in = [p['href'] for p in posts])
+        existing = dict((link.link, link.pk) for link in existing)
+        for p in posts:
+            if p['href'] in existing:
+                self.synced_posts.create(url_hash = p['hash'], meta_hash = '',
+                        link_id = existing.pop(p['href']))
+
+    def _sync_batch(self, posts):
+        self._adopt_links(posts)
+        known = set(self.synced_posts.filter(url_hash__in = [p['hash'] for p in posts])
+                                     .values_list('url_hash', flat = True))
+        self._update_synced([p for p in posts if p['hash'] in known])
+
+        new = [p for p in posts if p['hash'] not in known]
+        if not new:
+            return
+        def record(links):
+            insert_objects(DeliciousPost, [
+                DeliciousPost(updater = self, url_hash = p['hash'], meta_hash = p['meta'], link = link)
+                for p, link in zip(new, links)])
+        import_links(self.blog, [self._bookmark(p) for p in new], on_created = record)
+
+    def update_links(self, api=None, deadline=None):
+        """
+        Sync the account's bookmarks into the blog, and return how many
+        were new or changed. api defaults to a DeliciousAPI throttled by
+        the module-wide Waiter; past deadline (a time.time()) SyncTimeout
+        is raised between batches, and the next sync picks up from there.
+        """
+        if api is None:
+            api = DeliciousAPI(self.username, self.password)
 
         # get the latest update according to delicious
         latest_update_utc = api.posts_update()
         latest_update_utc = utc_to_epoch(latest_update_utc['update']['time'])
 
-        if self.last_known_update_utc < latest_update_utc:
-            posts = api.posts_all(fromdt=self._last_update_timestring())
+        if self.last_known_update_utc >= latest_update_utc:
+            return 0
+
+        synced = 0
+        for posts in self._changed_posts(api):
+            if deadline is not None and time.time() > deadline:
+                raise SyncTimeout, "gave up after %d bookmarks" % synced
+            self._sync_batch(posts)
+            synced += len(posts)
 
-            for p in posts['posts']:
-                link = LinkPost()
-                link.blog_id = self.blog_id
-                link.title = p['description']
-                link.link = p['href']
-                link.description_raw = p['extended']
-                link.publish(publish_time = self._parse_datetime(p['time']))
+        self.last_known_update_utc = latest_update_utc
+        self.save()
+        return synced
 
-                link.tags = p['tag']
-                link.save()
+class DeliciousPost(models.Model):
+    """
+    A bookmark synced by a DeliciousUpdater, by the MD5 of its url, with
+    the meta hash delicious changes whenever the bookmark is edited.
+    """
+    updater = models.ForeignKey(DeliciousUpdater, related_name = 'synced_posts')
+    url_hash = models.CharField(max_length = 32)
+    meta_hash = models.CharField(max_length = 32)
+    link = models.ForeignKey(LinkPost)
 
-            self.last_known_update_utc = self._parse_time(posts['update']) + 1
-            self.save()
+    class Meta:
+        unique_together = (('updater', 'url_hash'),)
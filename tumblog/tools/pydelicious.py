@@ -21,13 +21,20 @@ TODO:
 """
 import sys
 import os
+import base64
 import time
 import datetime
+import cPickle as pickle
 import locale
+import random
 import httplib
+import socket
+import threading
 import urllib2
-from urllib import urlencode, quote_plus
+import zlib
+from urllib import urlencode, quote_plus, addinfourl
 from StringIO import StringIO
+from email.utils import parsedate_tz, mktime_tz
 from pprint import pformat
 
 v = sys.version_info
@@ -37,10 +44,10 @@ else:
     from md5 import md5
 
 try:
-    from elementtree.ElementTree import parse as parse_xml
+    from elementtree.ElementTree import parse as parse_xml, iterparse
 except ImportError:
     # Python 2.5 and higher
-    from xml.etree.ElementTree import parse as parse_xml
+    from xml.etree.ElementTree import parse as parse_xml, iterparse
 
 try:
     import feedparser
@@ -71,8 +78,20 @@ DLCS_OK_MESSAGES = ('done', 'ok')
 "Known text values of positive del.icio.us <result/> answers"
 DLCS_WAIT_TIME = 4
 "Time to wait between API requests"
+DLCS_BACKOFF_BASE = DLCS_WAIT_TIME
+"First delay after a failed or throttled request, doubled on each failure"
+DLCS_BACKOFF_MAX = 300
+"Longest delay after failed or throttled requests"
 DLCS_REQUEST_TIMEOUT = 444
-"Seconds before socket triggers timeout"
+"Seconds before a request times out, unless it sets its own timeout"
+DLCS_POOL_SIZE = 10
+"Idle keep-alive connections kept per host, see `ConnectionPool`"
+DLCS_CONCURRENCY = 10
+"Threads running the requests of `ConcurrentDeliciousAPI` instances"
+DLCS_CACHE_SIZE = 50 * 1024 * 1024
+"Bytes of disk the feed cache may use, see `ResponseCache`"
+DLCS_CACHE_TEMP_AGE = 3600
+"Seconds after which `ResponseCache` removes temp files left by a failed write"
 #DLCS_API_REALM = 'del.icio.us API'
 DLCS_API_HOST = 'api.del.icio.us'
 DLCS_API_PATH = 'v1'
@@ -105,63 +124,140 @@ if 'HTTP_PROXY' in os.environ:
         print >>sys.stderr, \
             "Set HTTP_PROXY to %i from env." % HTTP_PROXY
 
-### Timeoutsocket hack taken from FeedParser.py
-
-# timeoutsocket allows feedparser to time out rather than hang forever on ultra-
-# slow servers. Python 2.3 now has this functionality available in the standard
-# socket library, so under 2.3 you don't need to install anything.  But you
-# probably should anyway, because the socket module is buggy and timeoutsocket
-# is better.
-try:
-    import timeoutsocket # http://www.timo-tasi.org/python/timeoutsocket.py
-    timeoutsocket.setDefaultSocketTimeout(DLCS_REQUEST_TIMEOUT)
-except ImportError:
-    import socket
-    if hasattr(socket, 'setdefaulttimeout'):
-        socket.setdefaulttimeout(DLCS_REQUEST_TIMEOUT)
-if DEBUG: print >>sys.stderr, \
-    "Set socket timeout to %s seconds" % DLCS_REQUEST_TIMEOUT
-
-
 ### Utility classes
 
-class _Waiter:
-    """Waiter makes sure a certain amount of time passes between
-    successive calls of `Waiter()`.
+class TokenBucket:
+    """Rate limiter: calling it takes a token, sleeping until one is
+    available. Tokens come in at `rate` per second and up to `burst` of them
+    can be saved up. After a throttled request, `backoff()` holds all callers
+    off with exponential backoff and jitter, or for as long as the server
+    asked. Safe to share between threads; sleeps happen outside the lock.
 
     Some attributes:
-    :last: time of last call
-    :wait: the minimum time needed between calls
+    :rate: tokens per second
+    :burst: the most tokens saved up
     :waited: the number of calls throttled
-
-    pydelicious.Waiter is an instance created when the module is loaded.
+    :wait_time: the total seconds callers slept
+    :backoffs: the number of times `backoff()` was called
     """
-    def __init__(self, wait):
-        self.wait = wait
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
         self.waited = 0
-        self.lastcall = 0;
+        self.wait_time = 0.0
+        self.backoffs = 0
+        self._tokens = burst
+        self._updated = time.time()
+        self._blocked_until = 0
+        self._failures = 0
+        self._lock = threading.Lock()
 
     def __call__(self):
-        tt = time.time()
-        wait = self.wait
-
-        timeago = tt - self.lastcall
-
-        if timeago < wait:
-            wait = wait - timeago
+        self._lock.acquire()
+        try:
+            now = time.time()
+            # during a backoff `_updated` lies ahead, and nothing accrues
+            # until the block is over
+            if now > self._updated:
+                self._tokens = min(self.burst,
+                        self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+            # take the token now, even if it comes in later: a negative
+            # balance queues callers up behind each other
+            self._tokens -= 1
+            wait = self._updated - now + max(-self._tokens, 0) / self.rate
+            if wait > 0:
+                self.waited += 1
+                self.wait_time += wait
+        finally:
+            self._lock.release()
+
+        if wait > 0:
             if DEBUG>0: print >>sys.stderr, "Waiting %s seconds." % wait
             time.sleep(wait)
-            self.waited += 1
-            self.lastcall = tt + wait
-        else:
-            self.lastcall = tt
+
+    def backoff(self, retry_after=None):
+        """Hold calls off after a failed or throttled request, for
+        `retry_after` seconds if given, otherwise for an exponentially
+        growing, jittered delay."""
+        self._lock.acquire()
+        try:
+            self.backoffs += 1
+            self._failures += 1
+            if retry_after is None:
+                delay = float(min(DLCS_BACKOFF_MAX,
+                        DLCS_BACKOFF_BASE * 2 ** (self._failures - 1)))
+                delay = delay / 2 + random.uniform(0, delay / 2)
+            else:
+                delay = retry_after
+            self._blocked_until = max(self._blocked_until, time.time() + delay)
+            # refill from an empty bucket once the block is over, so queued
+            # callers go out at the regular rate from then on
+            self._tokens = 0
+            self._updated = max(self._updated, self._blocked_until)
+        finally:
+            self._lock.release()
+
+    def succeeded(self):
+        """Resets the backoff after a successful request."""
+        self._lock.acquire()
+        try:
+            self._failures = 0
+        finally:
+            self._lock.release()
+
+
+class RateLimiter:
+    """A `TokenBucket` per key, eg. per host or per account, created on
+    first use."""
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return self._buckets[key]
+        finally:
+            self._lock.release()
+
+    def wait_time(self):
+        """Returns the seconds slept per key."""
+        self._lock.acquire()
+        try:
+            return dict([(key, bucket.wait_time)
+                    for key, bucket in self._buckets.items()])
+        finally:
+            self._lock.release()
+
+
+class _Waiter(TokenBucket):
+    """Waiter makes sure a certain amount of time passes between
+    successive calls of `Waiter()`, on average: a `TokenBucket` with a rate
+    of one call per `wait` seconds.
+
+    pydelicious.Waiter is an instance created when the module is loaded.
+    """
+    def __init__(self, wait, burst=1):
+        TokenBucket.__init__(self, 1.0 / wait, burst)
+        self.wait = wait
 
 Waiter = _Waiter(DLCS_WAIT_TIME)
 
 
 class PyDeliciousException(Exception):
     """Standard pydelicious error"""
-class PyDeliciousThrottled(Exception): pass
+class PyDeliciousThrottled(Exception):
+    """Raised on 503 answers, `retry_after` is the seconds the server asked
+    to wait, or None"""
+    def __init__(self, msg, retry_after=None):
+        Exception.__init__(self, msg)
+        self.retry_after = retry_after
 class PyDeliciousUnauthorized(Exception): pass
 
 class DeliciousError(Exception):
@@ -187,9 +283,389 @@ class HTTPErrorHandler(urllib2.HTTPDefaultErrorHandler):
     def http_error_503(self, req, fp, code, msg, headers):
         # Retry-After?
         errmsg = "Try again later."
+        retry_after = None
         if 'Retry-After' in headers:
             errmsg = "You may try again after %s" % headers['Retry-After']
-        raise PyDeliciousThrottled, errmsg
+            retry_after = parse_retry_after(headers['Retry-After'])
+        raise PyDeliciousThrottled(errmsg, retry_after)
+
+
+def parse_retry_after(value):
+    "Seconds to wait for a Retry-After header, in seconds or as a date"
+    try:
+        return max(0, int(value))
+    except ValueError:
+        date = parsedate_tz(value)
+        if date is None:
+            return None
+        return max(0, mktime_tz(date) - time.time())
+
+
+### HTTP transport
+
+class ConnectionPool:
+    """Keeps idle keep-alive HTTP(S) connections for reuse, up to `size` per
+    scheme and host. Safe to share between threads; a connection is only
+    ever used by one request at a time.
+
+    Some attributes:
+    :size: the maximum number of idle connections kept per host
+    :created: the number of connections opened so far
+    """
+    def __init__(self, size):
+        self.size = size
+        self.created = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, scheme, host, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        """Returns ``(connection, reused)``, reusing an idle connection to
+        the host if there is one."""
+        self._lock.acquire()
+        try:
+            idle = self._idle.get((scheme, host))
+            if idle:
+                conn = idle.pop()
+            else:
+                conn = None
+                self.created += 1
+        finally:
+            self._lock.release()
+
+        if conn is None:
+            if scheme == 'https':
+                return httplib.HTTPSConnection(host, timeout=timeout), False
+            return httplib.HTTPConnection(host, timeout=timeout), False
+
+        if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+            timeout = socket.getdefaulttimeout()
+        conn.timeout = timeout
+        if conn.sock:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def put(self, scheme, host, conn):
+        """Returns a connection whose response was read completely."""
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < self.size:
+                idle.append(conn)
+                conn = None
+        finally:
+            self._lock.release()
+        if conn is not None:
+            conn.close()
+
+    def clear(self):
+        """Closes all idle connections."""
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+HTTP_POOL = ConnectionPool(DLCS_POOL_SIZE)
+"The pool shared by all openers built by this module"
+
+
+class PooledResponse:
+    """File-like body of a response on a pooled connection. Decodes gzip
+    on the fly, and hands the connection back to the pool once the body has
+    been read to the end; closing it before then drops the connection."""
+
+    def __init__(self, response, release, gzipped=False):
+        self._response = response
+        self._release = release
+        self._decoder = None
+        if gzipped:
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buffer = ''
+        self._done = False
+
+    def _fill(self, size):
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            chunk = self._response.read(8192)
+            if not chunk:
+                if self._decoder:
+                    self._buffer += self._decoder.flush()
+                self._done = True
+                self._release(True)
+            elif self._decoder:
+                self._buffer += self._decoder.decompress(chunk)
+            else:
+                self._buffer += chunk
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        while '\n' not in self._buffer and not self._done:
+            self._fill(len(self._buffer) + 8192)
+        end = self._buffer.find('\n') + 1 or len(self._buffer)
+        if size >= 0:
+            end = min(end, size)
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+    def readlines(self):
+        return list(iter(self.readline, ''))
+
+    def close(self):
+        if not self._done:
+            self._done = True
+            self._release(False)
+
+
+class PooledHTTPHandler(urllib2.HTTPHandler):
+    """urllib2 handler for http and https that keeps connections alive in a
+    `ConnectionPool` (`HTTP_POOL` by default) and asks for gzip responses.
+    """
+    # take https_open before the default HTTPSHandler
+    handler_order = urllib2.HTTPHandler.handler_order - 50
+
+    def __init__(self, pool=None):
+        urllib2.HTTPHandler.__init__(self)
+        self.pool = pool or HTTP_POOL
+
+    def http_open(self, req):
+        return self._open('http', req)
+
+    def https_open(self, req):
+        return self._open('https', req)
+
+    https_request = urllib2.AbstractHTTPHandler.do_request_
+
+    def _open(self, scheme, req):
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(req.headers)
+        headers['Connection'] = 'keep-alive'
+        headers['Accept-Encoding'] = 'gzip'
+        timeout = getattr(req, 'timeout', socket._GLOBAL_DEFAULT_TIMEOUT)
+
+        while True:
+            conn, reused = self.pool.get(scheme, host, timeout)
+            try:
+                conn.request(req.get_method(), req.get_selector(), req.data, headers)
+                response = conn.getresponse()
+                break
+            except (socket.error, httplib.HTTPException), e:
+                conn.close()
+                # the server may have closed an idle connection, try a new one
+                if not reused:
+                    raise urllib2.URLError(e)
+
+        def release(complete):
+            if complete and not response.will_close:
+                self.pool.put(scheme, host, conn)
+            else:
+                conn.close()
+
+        gzipped = response.getheader('content-encoding', '').lower() == 'gzip'
+        if gzipped:
+            del response.msg['content-encoding']
+        fp = PooledResponse(response, release, gzipped)
+        if not 200 <= response.status < 300:
+            # error handlers (eg. 401 challenges) retry without reading or
+            # closing the body; read it now so the connection goes back
+            fp = StringIO(fp.read())
+
+        resp = addinfourl(fp, response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+
+class PreemptiveBasicAuthHandler(urllib2.BaseHandler):
+    """Sends HTTP Basic credentials with every request to one host, rather
+    than waiting for a 401 challenge and asking again."""
+
+    def __init__(self, host, user, passwd):
+        self.host = host
+        self.authorization = 'Basic %s' % base64.b64encode('%s:%s' % (user, passwd))
+
+    def http_request(self, req):
+        if req.get_host() == self.host:
+            req.add_unredirected_header('Authorization', self.authorization)
+        return req
+
+    https_request = http_request
+
+
+class NotModifiedHandler(urllib2.BaseHandler):
+    """Returns 304 answers to conditional requests as responses, rather
+    than raising them as errors."""
+
+    def http_error_304(self, req, fp, code, msg, headers):
+        response = addinfourl(fp, headers, req.get_full_url())
+        response.code = code
+        response.msg = msg
+        return response
+
+
+def build_opener(*handlers):
+    """urllib2.build_opener() with a `PooledHTTPHandler` and a
+    `NotModifiedHandler`"""
+    return urllib2.build_opener(PooledHTTPHandler(), NotModifiedHandler(),
+            *handlers)
+
+
+### Response cache
+
+class ResponseCache:
+    """On-disk cache of fetched documents and what they parsed to, for
+    revalidating with conditional requests. Each URL is one pickle in
+    `directory`. Once the files take up more than `size` bytes the least
+    recently used ones are removed. Writes are atomic renames, so several
+    threads or processes can share a directory.
+    """
+    def __init__(self, directory, size=DLCS_CACHE_SIZE):
+        self.directory = directory
+        self.size = size
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, url):
+        return os.path.join(self.directory, md5(url).hexdigest() + '.cache')
+
+    def get(self, url):
+        """Returns the entry for the url, a dict with `etag`,
+        `last_modified`, `body` and `parsed`, or None."""
+        path = self._path(url)
+        try:
+            fl = open(path, 'rb')
+            try:
+                entry = pickle.load(fl)
+            finally:
+                fl.close()
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        self.touch(url)
+        return entry
+
+    def touch(self, url):
+        "Marks the url's entry as recently used."
+        try:
+            os.utime(self._path(url), None)
+        except OSError:
+            pass
+
+    def set(self, url, entry):
+        path = self._path(url)
+        temp = "%s.%s.%s" % (path, os.getpid(), threading.currentThread().getName())
+        fl = open(temp, 'wb')
+        try:
+            try:
+                pickle.dump(entry, fl, pickle.HIGHEST_PROTOCOL)
+            finally:
+                fl.close()
+            os.rename(temp, path)
+        except:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries above `size` bytes, and
+        temp files older than `DLCS_CACHE_TEMP_AGE`."""
+        self._lock.acquire()
+        try:
+            files = []
+            stale = time.time() - DLCS_CACHE_TEMP_AGE
+            for name in os.listdir(self.directory):
+                is_temp = '.cache.' in name
+                if not (name.endswith('.cache') or is_temp):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                    # left behind by a writer that died mid-write
+                    if is_temp and st.st_mtime < stale:
+                        os.remove(path)
+                except OSError:
+                    continue
+                if not is_temp:
+                    files.append((st.st_mtime, st.st_size, path))
+
+            total = sum([size for mtime, size, path in files])
+            files.sort()
+            while files and total > self.size:
+                mtime, size, path = files.pop(0)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+        finally:
+            self._lock.release()
+
+
+FEED_CACHE = None
+"The `ResponseCache` used by the RSS and feed functions, None to disable"
+if 'DLCS_CACHE_DIR' in os.environ:
+    FEED_CACHE = ResponseCache(os.environ['DLCS_CACHE_DIR'], DLCS_CACHE_SIZE)
+    if DEBUG:
+        print >>sys.stderr, \
+            "Caching feeds in %s from env." % FEED_CACHE.directory
+
+
+def cached_request(url, parse, cache=None):
+    """Returns ``parse(body)`` for the document at `url`. With a `cache`
+    (defaults to `FEED_CACHE`) the request is made conditional on the
+    cached ETag and Last-Modified, and a 304 answer returns the cached
+    parse without reading or parsing anything."""
+    if cache is None:
+        cache = FEED_CACHE
+    if cache is None:
+        return parse(http_request(url).read())
+
+    entry = cache.get(url)
+    headers = {}
+    if entry:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    fl = http_request(url, headers=headers)
+    if getattr(fl, 'code', None) == 304 and entry:
+        fl.read()
+        fl.close()
+        return entry['parsed']
+
+    body = fl.read()
+    info = fl.info()
+    parsed = parse(body)
+    if info.get('etag') or info.get('last-modified'):
+        stored = parsed
+        if isinstance(parsed, dict) and 'bozo_exception' in parsed:
+            # feedparser's parse errors often don't pickle, keep the flag only
+            stored = type(parsed)(parsed)
+            del stored['bozo_exception']
+        try:
+            cache.set(url, {'etag': info.get('etag'),
+                'last_modified': info.get('last-modified'),
+                'body': body, 'parsed': stored})
+        except (pickle.PicklingError, TypeError):
+            # not cacheable, the next request fetches it all again
+            pass
+    return parsed
 
 
 ### Utility functions
@@ -206,15 +682,27 @@ def delicious_datetime(str):
     return datetime.datetime(*time.strptime(str, ISO_8601_DATETIME)[0:6])
 
 
-def http_request(url, user_agent=USER_AGENT, retry=4, opener=None):
+def http_request(url, user_agent=USER_AGENT, retry=4, opener=None,
+        waiter=None, timeout=None, headers=None):
     """Retrieve the contents referenced by the URL using urllib2.
 
-    Retries up to four times (default) on exceptions.
+    Retries up to four times (default) on exceptions and throttling,
+    backing off with `waiter` (defaults to the module `Waiter`) in between.
+    `timeout` sets the socket timeout for this request only, and defaults
+    to `DLCS_REQUEST_TIMEOUT`; the process-wide socket default is left alone.
+    `headers` are sent along with the User-Agent.
     """
     request = urllib2.Request(url, headers={'User-Agent':user_agent})
+    for name, value in (headers or {}).items():
+        request.add_header(name, value)
 
     if not opener:
-        opener = urllib2.build_opener()
+        opener = build_opener()
+
+    if not waiter:
+        waiter = Waiter
+    if timeout is None:
+        timeout = DLCS_REQUEST_TIMEOUT
 
     # Remember last error
     e = None
@@ -223,7 +711,17 @@ def http_request(url, user_agent=USER_AGENT, retry=4, opener=None):
     tries = retry;
     while tries:
         try:
-            return opener.open(request)
+            response = opener.open(request, timeout=timeout)
+            waiter.succeeded()
+            return response
+
+        except PyDeliciousThrottled, e:
+            print >> sys.stderr, "%s, %s tries left." % (e, tries)
+            tries = tries - 1
+            if not tries:
+                raise
+            waiter.backoff(e.retry_after)
+            waiter()
 
         except urllib2.HTTPError, e:
             # reraise unexpected protocol errors as PyDeliciousException
@@ -233,7 +731,8 @@ def http_request(url, user_agent=USER_AGENT, retry=4, opener=None):
             # xxx: Ugly check for time-out errors
             #if len(e)>0 and 'timed out' in arg[0]:
             print >> sys.stderr, "%s, %s tries left." % (e, tries)
-            Waiter()
+            waiter.backoff()
+            waiter()
             tries = tries - 1
             #else:
             #	tries = None
@@ -258,11 +757,12 @@ def build_api_opener(host, user, passwd, extra_handlers=() ):
     password_manager.add_password(None, host, user, passwd)
     auth_handler = urllib2.HTTPBasicAuthHandler(password_manager)
 
-    extra_handlers += ( HTTPErrorHandler(), )
+    extra_handlers += ( PreemptiveBasicAuthHandler(host, user, passwd),
+            HTTPErrorHandler(), )
     if HTTP_PROXY:
         extra_handlers += ( urllib2.ProxyHandler( {'http': HTTP_PROXY} ), )
 
-    return urllib2.build_opener(auth_handler, *extra_handlers)
+    return build_opener(auth_handler, *extra_handlers)
 
 
 def dlcs_api_opener(user, passwd):
@@ -272,16 +772,18 @@ def dlcs_api_opener(user, passwd):
 
 
 def dlcs_api_request(path, params='', user='', passwd='', throttle=True,
-        opener=None):
+        opener=None, waiter=None, timeout=None):
     """Retrieve/query a path within the del.icio.us API.
 
     This implements a minimum interval between calls to avoid
     throttling. [#]_ Use param 'throttle' to turn this behaviour off.
+    The interval is kept by `waiter`, the module `Waiter` by default; pass
+    a `TokenBucket` per account to throttle accounts independently.
 
     .. [#] http://del.icio.us/help/api/
     """
     if throttle:
-        Waiter()
+        (waiter or Waiter)()
 
     if params:
         url = "%s/%s?%s" % (DLCS_API, path, urlencode(params))
@@ -294,7 +796,7 @@ def dlcs_api_request(path, params='', user='', passwd='', throttle=True,
     if not opener:
         opener = dlcs_api_opener(user, passwd)
 
-    fl = http_request(url, opener=opener)
+    fl = http_request(url, opener=opener, waiter=waiter, timeout=timeout)
 
     if DEBUG>2: print >>sys.stderr, \
             pformat(fl.info().headers)
@@ -336,7 +838,9 @@ def dlcs_encode_params(params, usercodec=PREFERRED_ENCODING):
     return params
 
 
-def dlcs_parse_xml(data, split_tags=False):
+DLCS_DATA_FORMATS = ('tags', 'posts', 'dates', 'bundles')
+
+def dlcs_parse_xml(data, split_tags=False, stream=False):
     """Parse any del.icio.us XML document and return Python data structure.
 
     Recognizes all XML document formats as returned by the version 1 API and
@@ -349,6 +853,9 @@ def dlcs_parse_xml(data, split_tags=False):
      {'dates': [{'count':'...','date':'...'},], 'tag':'', 'user':'...'}
      {'result':(True, "done")}
      # etcetera.
+
+    With ``stream=True`` the list of data elements is instead an iterator
+    that parses the document as it goes, see ``dlcs_stream_xml()``.
     """
     # TODO: split_tags is not implemented
 
@@ -357,18 +864,26 @@ def dlcs_parse_xml(data, split_tags=False):
     if not hasattr(data, 'read'):
         data = StringIO(data)
 
-    doc = parse_xml(data)
-    root = doc.getroot()
+    if stream:
+        return dlcs_stream_xml(data)
+
+    return dlcs_parse_root(parse_xml(data).getroot())
+
+
+def dlcs_parse_root(root):
+    """Translate the parsed root element of a del.icio.us XML document, see
+    ``dlcs_parse_xml()``."""
+
     fmt = root.tag
 
     # Split up into three cases: Data, Result or Update
-    if fmt in ('tags', 'posts', 'dates', 'bundles'):
+    if fmt in DLCS_DATA_FORMATS:
 
         # Data: expect a list of data elements, 'resources'.
         # Use `fmt` (without last 's') to find data elements, elements
         # don't have contents, attributes contain all the data we need:
         # append to list
-        elist = [el.attrib for el in doc.findall(fmt[:-1])]
+        elist = [el.attrib for el in root.findall(fmt[:-1])]
 
         # Return list in dict, use tagname of rootnode as keyname.
         data = {fmt: elist}
@@ -401,6 +916,39 @@ def dlcs_parse_xml(data, split_tags=False):
         raise PyDeliciousException, "Unknown XML document format '%s'" % fmt
 
 
+def dlcs_stream_xml(data):
+    """Parse a del.icio.us XML document incrementally.
+
+    Data documents are returned as by ``dlcs_parse_xml()``, except that the
+    list of data elements is a generator: it reads the document as it is
+    iterated and drops every element once its attributes are yielded, so
+    memory use does not grow with the size of the document. Iterate it
+    before reading from `data` again. Other documents are small and are
+    parsed completely.
+    """
+    events = iterparse(data, events=('start', 'end'))
+    event, root = events.next()
+    fmt = root.tag
+
+    if fmt not in DLCS_DATA_FORMATS:
+        for event, el in events:
+            pass
+        return dlcs_parse_root(root)
+
+    data = dict(root.attrib)
+    data[fmt] = _stream_elements(events, root, fmt[:-1])
+    return data
+
+
+def _stream_elements(events, root, tag):
+    for event, el in events:
+        if event == 'end' and el.tag == tag:
+            attrib = dict(el.attrib)
+            # forget the elements parsed so far
+            root.clear()
+            yield attrib
+
+
 def dlcs_rss_request(tag="", popular=0, user="", url=''):
     """Parse a RSS request.
 
@@ -438,7 +986,11 @@ def dlcs_rss_request(tag="", popular=0, user="", url=''):
     if DEBUG:
         print 'dlcs_rss_request', url
 
-    rss = http_request(url).read()
+    return cached_request(url, dlcs_parse_rss)
+
+
+def dlcs_parse_rss(rss):
+    """Parse the posts out of a RSS document, see dlcs_rss_request()"""
 
     # assert feedparser, "dlcs_rss_request requires feedparser to be installed."
     if not feedparser:
@@ -554,18 +1106,11 @@ def dlcs_feed(name_or_url, url_map=delicious_v2_feeds, count=15, **params):
     if DEBUG:
         print 'dlcs_feed', url
 
-    feed = http_request(url).read()
+    if format == 'rss' and feedparser:
+        return cached_request(url, feedparser.parse)
 
-    if format == 'rss':
-        if feedparser:
-            rss = feedparser.parse(feed)
-            return rss
-
-        else:
-            return feed
-
-    elif format == 'json':
-        return feed
+    elif format in ('rss', 'json'):
+        return cached_request(url, str)
 
 
 ### Main module class
@@ -583,7 +1128,8 @@ class DeliciousAPI:
 
     def __init__(self, user, passwd, codec=PREFERRED_ENCODING,
             api_request=dlcs_api_request, xml_parser=dlcs_parse_xml,
-            build_opener=dlcs_api_opener, encode_params=dlcs_encode_params):
+            build_opener=dlcs_api_opener, encode_params=dlcs_encode_params,
+            waiter=None, timeout=None):
 
         """Initialize access to the API for ``user`` with ``passwd``.
 
@@ -600,8 +1146,12 @@ class DeliciousAPI:
         with HTTP authentication. See ``dlcs_api_opener()`` for the default
         implementation.
 
-        ``encode_params`` finally preprocesses API parameters before
+        ``encode_params`` preprocesses API parameters before
         they are passed to ``api_request``.
+
+        ``waiter`` and ``timeout`` finally are passed on to ``api_request``
+        when given, to throttle this instance separately from others and to
+        time out its requests. See ``dlcs_api_request()``.
         """
 
         assert user != ""
@@ -619,9 +1169,15 @@ class DeliciousAPI:
         assert callable(xml_parser)
         self._parse_response = xml_parser
 
+        self._request_options = {}
+        if waiter is not None:
+            self._request_options['waiter'] = waiter
+        if timeout is not None:
+            self._request_options['timeout'] = timeout
+
     ### Core functionality
 
-    def request(self, path, _raw=False, **params):
+    def request(self, path, _raw=False, _stream=False, **params):
         """Sends a request message to `path` in the API, and parses the results
         from XML. Use with ``_raw=True`` or ``call request_raw()`` directly
         to get the filehandler and process the response message manually.
@@ -639,7 +1195,9 @@ class DeliciousAPI:
         Positive answers are silently accepted and nothing is returned.
 
         Using ``_raw=True`` bypasses all parsing and never raises
-        ``DeliciousError``.
+        ``DeliciousError``. With ``_stream=True`` the data elements are
+        parsed as they are iterated, see ``dlcs_stream_xml()``; the
+        ``xml_parser`` must then accept a `stream` argument.
 
         See ``dlcs_parse_xml()`` and ``self.request_raw()``."""
 
@@ -651,8 +1209,12 @@ class DeliciousAPI:
             params = self._encode_params(params, self.codec)
 
             # get answer and parse
-            fl = self._api_request(path, params=params, opener=self._opener)
-            rs = self._parse_response(fl)
+            fl = self._api_request(path, params=params, opener=self._opener,
+                    **self._request_options)
+            if _stream:
+                rs = self._parse_response(fl, stream=True)
+            else:
+                rs = self._parse_response(fl)
 
             if type(rs) == dict and 'result' in rs:
                 if not rs['result'][0]:
@@ -676,7 +1238,8 @@ class DeliciousAPI:
         """
         # see `request()` on how the response can be handled
         params = self._encode_params(params, self.codec)
-        return self._api_request(path, params=params, opener=self._opener)
+        return self._api_request(path, params=params, opener=self._opener,
+                **self._request_options)
 
     ### Explicit declarations of API paths, their parameters and docs
 
@@ -775,7 +1338,7 @@ class DeliciousAPI:
         return self.request("posts/recent", tag=tag, count=count, **kwds)
 
     def posts_all(self, tag="", start=None, results=None, fromdt=None,
-            todt=None, meta=True, hashes=False, **kwds):
+            todt=None, meta=True, hashes=False, stream=False, **kwds):
         """Returns all posts. Please use sparingly. Call the `posts_update`
         method to see if you need to fetch this at all.
         ::
@@ -802,12 +1365,16 @@ class DeliciousAPI:
         &hashes
             (optional, exclusive) Do not fetch post details but a posts
             manifest with url- and meta-hashes. Other options do not apply.
+
+        With ``stream=True`` the posts are a generator of post dicts parsed
+        as the response arrives, rather than a list. See ``self.request()``.
         """
         if hashes:
-            return self.request("posts/all", hashes=hashes, **kwds)
+            return self.request("posts/all", _stream=stream, hashes=hashes, **kwds)
         else:
-            return self.request("posts/all", tag=tag, fromdt=fromdt, todt=todt,
-                    start=start, results=results, meta=meta, **kwds)
+            return self.request("posts/all", _stream=stream, tag=tag,
+                    fromdt=fromdt, todt=todt, start=start, results=results,
+                    meta=meta, **kwds)
 
     def posts_add(self, url, description, extended="", tags="", dt="",
             replace=False, shared=True, **kwds):
@@ -909,6 +1476,54 @@ class DeliciousAPI:
         return "DeliciousAPI(%s)" % self.user
 
 
+class ConcurrentDeliciousAPI(DeliciousAPI):
+    """A `DeliciousAPI` whose requests run on a pool of threads, so that
+    many of them can be in flight at once. Every method returns at once with
+    a ``multiprocessing.pool.AsyncResult``; call its ``get(timeout)`` for the
+    parsed answer, or the exception the request raised.
+    ::
+
+        api = ConcurrentDeliciousAPI(user, passwd, timeout=30)
+        pending = [api.posts_get(hashes=batch) for batch in batches]
+        posts = [p for answer in pending for p in answer.get()['posts']]
+
+    Requests still share the instance's `waiter`, so a single account is
+    not requested any faster than a `DeliciousAPI` would; use one instance
+    per account to query accounts concurrently. All instances share one
+    pool of `DLCS_CONCURRENCY` threads unless given their own `pool`.
+    """
+
+    def __init__(self, user, passwd, pool=None, **kwds):
+        DeliciousAPI.__init__(self, user, passwd, **kwds)
+        self._pool = pool
+
+    def request(self, path, _raw=False, _stream=False, **params):
+        pool = self._pool or _concurrent_pool()
+        return pool.apply_async(DeliciousAPI.request, (self, path, _raw,
+                _stream), params)
+
+    def request_raw(self, path, **params):
+        return self.request(path, _raw=True, **params)
+
+    def __repr__(self):
+        return "ConcurrentDeliciousAPI(%s)" % self.user
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _concurrent_pool():
+    "The thread pool shared by ConcurrentDeliciousAPI instances"
+    global _pool
+    _pool_lock.acquire()
+    try:
+        if _pool is None:
+            from multiprocessing.pool import ThreadPool
+            _pool = ThreadPool(DLCS_CONCURRENCY)
+        return _pool
+    finally:
+        _pool_lock.release()
+
+
 ### Convenience functions on this package
 
 def apiNew(user, passwd):
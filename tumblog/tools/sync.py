@@ -0,0 +1,95 @@
+"""
+Syncing every DeliciousUpdater at once. Accounts are synced concurrently
+on a pool of threads, each account throttled by its own token bucket so
+that a few hundred of them don't queue behind pydelicious' module-wide
+Waiter.
+"""
+import logging
+import time
+from django.conf import settings
+from django.db import connection
+
+from tumblog.tools.models import DeliciousUpdater, SyncTimeout
+from tumblog.tools.pydelicious import DeliciousAPI, RateLimiter, DLCS_WAIT_TIME
+
+SYNC_THREADS = getattr(settings, 'TUMBLOG_DELICIOUS_SYNC_THREADS', 10)
+# seconds an account may take in all, and per request
+SYNC_TIMEOUT = getattr(settings, 'TUMBLOG_DELICIOUS_SYNC_TIMEOUT', 600)
+REQUEST_TIMEOUT = getattr(settings, 'TUMBLOG_DELICIOUS_REQUEST_TIMEOUT', 60)
+# API requests per second and burst allowed per account
+REQUEST_RATE = getattr(settings, 'TUMBLOG_DELICIOUS_REQUEST_RATE', 1.0 / DLCS_WAIT_TIME)
+REQUEST_BURST = getattr(settings, 'TUMBLOG_DELICIOUS_REQUEST_BURST', 1)
+
+# kept for the life of the process, so back to back syncs stay throttled
+_accounts = RateLimiter(REQUEST_RATE, REQUEST_BURST)
+
+class SyncResult(object):
+    """ How syncing one updater went """
+    def __init__(self, updater, items=0, seconds=0, waited=0, error=None):
+        self.updater = updater
+        self.items = items
+        self.seconds = seconds
+        self.waited = waited
+        self.error = error
+
+    def __unicode__(self):
+        status = self.error and "failed: %s" % self.error or "ok"
+        return u"%s -> %s: %d items in %.1fs (%.1fs throttled), %s" % (self.updater.username,
+                self.updater.blog_id, self.items, self.seconds, self.waited, status)
+
+def sync_account(updaters, timeout=None):
+    """
+    Sync the updaters of one delicious account, one after the other so
+    they share the account's rate limit. Returns a SyncResult for each.
+    """
+    if timeout is None:
+        timeout = SYNC_TIMEOUT
+    deadline = time.time() + timeout
+    waiter = _accounts.get(updaters[0].username)
+
+    results = []
+    try:
+        for updater in updaters:
+            start = time.time()
+            waited = waiter.wait_time
+            result = SyncResult(updater)
+            try:
+                if start > deadline:
+                    raise SyncTimeout, "not started"
+                api = DeliciousAPI(updater.username, updater.password, waiter = waiter,
+                        timeout = min(REQUEST_TIMEOUT, deadline - start))
+                result.items = updater.update_links(api, deadline)
+            except Exception, e:
+                logging.exception("syncing %s failed" % updater.username)
+                result.error = e
+            result.seconds = time.time() - start
+            result.waited = waiter.wait_time - waited
+            results.append(result)
+    finally:
+        connection.close()
+    return results
+
+def sync_all(updaters=None, threads=None, timeout=None):
+    """
+    Sync the updaters (all of them by default) on a pool of threads, one
+    account per thread at a time. Returns the SyncResults.
+    """
+    from multiprocessing.pool import ThreadPool
+
+    if updaters is None:
+        updaters = DeliciousUpdater.objects.all()
+    accounts = {}
+    for updater in updaters:
+        accounts.setdefault(updater.username, []).append(updater)
+    if not accounts:
+        return []
+
+    # the threads open their own connections
+    connection.close()
+    pool = ThreadPool(min(threads or SYNC_THREADS, len(accounts)))
+    try:
+        synced = pool.map(lambda account: sync_account(account, timeout), accounts.values())
+    finally:
+        pool.close()
+        pool.join()
+    return [result for results in synced for result in results]
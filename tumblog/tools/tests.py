@@ -5,8 +5,26 @@ unittest). These will both pass when you run "manage.py test".
 Replace these with more appropriate tests for your application.
 """
 
+import base64
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib2
+from datetime import datetime, timedelta
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from StringIO import StringIO
+
 from django.test import TestCase
 
+from tumblog.models import Blog, Post, TextPost, LinkPost, TagCount
+from tumblog.tools import importer
+from tumblog.tools.importer import unique_slugs, import_links, reimport_links
+from tumblog.tools.pydelicious import ConnectionPool, PooledHTTPHandler, http_request, \
+        build_api_opener, HTTP_POOL, TokenBucket, ResponseCache
+
 class SimpleTest(TestCase):
     def test_basic_addition(self):
         """
@@ -14,10 +32,207 @@ class SimpleTest(TestCase):
         """
         self.failUnlessEqual(1 + 1, 2)
 
+class UniqueSlugsTest(TestCase):
+    def test_renamed_slugs_stay_unique(self):
+        """
+        Tests that a slug renamed in a later round doesn't clash with one
+        accepted earlier.
+        """
+        blog = Blog.objects.create(slug = 'test', title = 'Test', description_raw = '')
+        post = TextPost(blog = blog, title = 'Taken', body_raw = '')
+        post.publish()
+        Post.objects.filter(pk = post.pk).update(slug = 'foo-2')
+
+        slugs = unique_slugs(['foo', 'foo', 'foo-3'])
+        self.failUnlessEqual(len(set(slugs)), 3)
+        self.failIf('foo-2' in slugs)
+        self.failUnlessEqual(slugs[0], 'foo')
+        self.failUnlessEqual(slugs[2], 'foo-3')
+
+    def test_slug_taken_meanwhile(self):
+        """
+        Tests that an import picks a slug again when another import took it
+        between picking and inserting.
+        """
+        blog = Blog.objects.create(slug = 'test', title = 'Test', description_raw = '')
+        post = TextPost(blog = blog, title = 'Taken', body_raw = '')
+        post.publish()
+        Post.objects.filter(pk = post.pk).update(slug = 'foo')
+
+        picked = []
+        def stale_slugs(titles):
+            picked.append(titles)
+            if len(picked) == 1:
+                return ['foo']
+            return unique_slugs(titles)
+        importer.unique_slugs = stale_slugs
+        try:
+            links = import_links(blog, [{'title': 'Foo', 'link': 'http://example.com/',
+                    'description_raw': '', 'tags': 'foo', 'pubtime': datetime.now()}])
+        finally:
+            importer.unique_slugs = unique_slugs
+
+        self.failUnlessEqual(len(picked), 2)
+        self.failUnlessEqual(links[0].slug, 'foo-2')
+        self.failUnlessEqual(Post.objects.get(pk = links[0].pk).title, 'Foo')
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ Answers every GET with a gzipped body, keeping the connection open """
+    protocol_version = 'HTTP/1.1'
+    body = '<update time="2009-01-01T00:00:00Z" />'
+
+    def do_GET(self):
+        self.server.requests.append((self.client_address, self.headers.get('accept-encoding')))
+        if self.server.authorization and self.headers.get('authorization') != self.server.authorization:
+            challenge = 'Authorization required'
+            self.send_response(401)
+            self.send_header('WWW-Authenticate', 'Basic realm="del.icio.us API"')
+            self.send_header('Content-Length', str(len(challenge)))
+            self.end_headers()
+            self.wfile.write(challenge)
+            return
+
+        data = StringIO()
+        zipped = gzip.GzipFile(fileobj = data, mode = 'wb')
+        zipped.write(self.body)
+        zipped.close()
+
+        self.send_response(200)
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data.getvalue())))
+        self.end_headers()
+        self.wfile.write(data.getvalue())
+
+    def log_message(self, *args):
+        pass
+
+class ReimportLinksTest(TestCase):
+    def test_summaries(self):
+        """
+        Tests that updating links in bulk moves their tag counts, and
+        takes them offline when their pubtime moves into the future.
+        """
+        blog = Blog.objects.create(slug = 'test', title = 'Test', description_raw = '')
+        pubtime = datetime.now() - timedelta(days = 1)
+        bookmarks = [{'title': 'Link %d' % i, 'link': 'http://example.com/%d' % i,
+                'description_raw': '', 'tags': 'old', 'pubtime': pubtime} for i in range(2)]
+        links = import_links(blog, bookmarks)
+
+        bookmarks[0]['tags'] = 'new'
+        bookmarks[1]['pubtime'] = datetime.now() + timedelta(days = 1)
+        reimport_links(blog, list(LinkPost.objects.filter(blog = blog).order_by('id')), bookmarks)
+
+        counts = dict((c.tag.name, c.count) for c in TagCount.objects.filter(blog = blog))
+        self.failUnlessEqual(counts.get('old', 0), 0)
+        self.failUnlessEqual(counts.get('new', 0), 1)
+        self.failIf(Post.objects.get(pk = links[1].pk).live)
+        self.failUnlessEqual(LinkPost.objects.get(pk = links[0].pk).tags, 'new')
+
+class TokenBucketTest(TestCase):
+    def test_backoff_queue(self):
+        """
+        Tests that callers queued up behind a backoff go out at the
+        regular rate once it is over, not all at once.
+        """
+        bucket = TokenBucket(20)
+        bucket.backoff(0.2)
+        done = []
+        def call():
+            bucket()
+            done.append(time.time())
+        threads = [threading.Thread(target = call) for i in range(5)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.sort()
+        self.failUnless(done[0] - start >= 0.2)
+        self.failUnless(done[-1] - done[0] >= 0.15)
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResponseCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_failed_write(self):
+        """
+        Tests that an entry that can't be pickled leaves no temp file
+        behind, and that stale temp files are cleaned up.
+        """
+        self.assertRaises(TypeError, self.cache.set, 'http://example.com/', {'parsed': threading.Lock()})
+        self.failUnlessEqual(os.listdir(self.directory), [])
+
+        stale = os.path.join(self.directory, 'abc.cache.1.Thread-1')
+        open(stale, 'wb').close()
+        os.utime(stale, (0, 0))
+        self.cache.set('http://example.com/', {'parsed': 'ok'})
+        self.failIf(os.path.exists(stale))
+        self.failUnlessEqual(self.cache.get('http://example.com/'), {'parsed': 'ok'})
+
+class PooledTransportTest(TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.requests = []
+        self.server.authorization = None
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.pool = ConnectionPool(2)
+        self.opener = urllib2.build_opener(PooledHTTPHandler(self.pool))
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive_and_gzip(self):
+        """
+        Tests that requests reuse one connection, and that gzipped
+        responses are decoded.
+        """
+        url = 'http://127.0.0.1:%d/v1/posts/update' % self.server.server_port
+        for i in range(3):
+            response = http_request(url, opener = self.opener)
+            self.failUnlessEqual(response.read(), StubHandler.body)
+            response.close()
+
+        self.failUnlessEqual(self.pool.created, 1)
+        self.failUnlessEqual(len(set([client for client, encoding in self.server.requests])), 1)
+        self.failUnlessEqual([encoding for client, encoding in self.server.requests], ['gzip'] * 3)
+
+    def test_basic_auth(self):
+        """
+        Tests that authenticated API requests share one connection, with
+        the credentials sent up front, and that 401 challenges answered
+        after the fact don't cost a connection either.
+        """
+        host = '127.0.0.1:%d' % self.server.server_port
+        url = 'http://%s/v1/posts/update' % host
+        self.server.authorization = 'Basic %s' % base64.b64encode('user:secret')
+
+        HTTP_POOL.clear()
+        created = HTTP_POOL.created
+        opener = build_api_opener(host, 'user', 'secret')
+        for i in range(3):
+            self.failUnlessEqual(http_request(url, opener = opener).read(), StubHandler.body)
+        self.failUnlessEqual(HTTP_POOL.created - created, 1)
+        self.failUnlessEqual(len(self.server.requests), 3)
+        HTTP_POOL.clear()
+
+        passwords = urllib2.HTTPPasswordMgrWithDefaultRealm()
+        passwords.add_password(None, host, 'user', 'secret')
+        opener = urllib2.build_opener(urllib2.HTTPBasicAuthHandler(passwords), PooledHTTPHandler(self.pool))
+        for i in range(3):
+            self.failUnlessEqual(http_request(url, opener = opener).read(), StubHandler.body)
+        self.failUnlessEqual(self.pool.created, 1)
+
 __test__ = {"doctest": """
 Another way to test that 1 + 1 is equal to 2.
 
 >>> 1 + 1 == 2
 True
 """}
-
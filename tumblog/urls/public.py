@@ -6,6 +6,7 @@ from tagging import views as tagging_list
 
 from tumblog.models import Post
 from tumblog.views.public import *
+from tumblog.views.feeds import feed
 
 date_info = {
     'queryset': Post.published.all(),
@@ -20,16 +21,26 @@ tag_info = {
     'paginate_by': settings.PAGINATION_COUNT,
 }
 
+# keyset pagination cursor, see tumblog.views.public._cursor_for
+cursor = r'c/(?P<cursor>\d{20}-\d+)/$'
+
 urlpatterns = patterns('',
     (r'^(?P<blogslug>[-\w]+)/(?P<year>\d{4})/(?P<month>\d{1,2})/(?P<day>\d{1,2})/$', archive_day, {}, 'tumblog.day'),
     (r'^(?P<blogslug>[-\w]+)/(?P<year>\d{4})/(?P<month>\d{1,2})/(?P<day>\d{1,2})/p/(?P<page>\d+)/$', archive_day, {}, 'tumblog.day.page'),
+    (r'^(?P<blogslug>[-\w]+)/(?P<year>\d{4})/(?P<month>\d{1,2})/(?P<day>\d{1,2})/' + cursor, archive_day, {}, 'tumblog.day.cursor'),
     (r'^(?P<blogslug>[-\w]+)/(?P<year>\d{4})/(?P<month>\d{1,2})/(?P<day>\d{1,2})/(?P<slug>[-\w]+)/$', archive_detail, {}, 'tumblog.post'),
     (r'^(?P<blogslug>[-\w]+)/(?P<year>\d{4})/(?P<month>\d{1,2})/$', archive_month, {}, 'tumblog.month'),
     (r'^(?P<blogslug>[-\w]+)/(?P<year>\d{4})/(?P<month>\d{1,2})/p/(?P<page>\d+)/$', archive_month, {}, 'tumblog.month.page'),
+    (r'^(?P<blogslug>[-\w]+)/(?P<year>\d{4})/(?P<month>\d{1,2})/' + cursor, archive_month, {}, 'tumblog.month.cursor'),
     (r'^(?P<blogslug>[-\w]+)/(?P<year>\d{4})/$', archive_year),
     (r'^(?P<blogslug>[-\w]+)/(?P<year>\d{4})/p/(?P<page>\d+)/$', archive_year, {}, 'tumblog.year.page'),
+    (r'^(?P<blogslug>[-\w]+)/(?P<year>\d{4})/' + cursor, archive_year, {}, 'tumblog.year.cursor'),
+    (r'^(?P<blogslug>[-\w]+)/' + cursor, archive_index, {}, 'tumblog.index.cursor'),
+    (r'^(?P<blogslug>[-\w]+)/feed/(?P<format>atom|rss)/$', feed, {}, 'tumblog.feed'),
+    (r'^(?P<blogslug>[-\w]+)/(?P<tag>[-\w]+)/feed/(?P<format>atom|rss)/$', feed, {}, 'tumblog.tag.feed'),
     (r'^(?P<blogslug>[-\w]+)/(?P<tag>[-\w]+)/$', archive_tagged, {}, 'tumblog.tag'),
     (r'^(?P<blogslug>[-\w]+)/(?P<tag>[-\w]+)/p/(?P<page>\d+)/$', archive_tagged, {}, 'tumblog.tag.page'),
+    (r'^(?P<blogslug>[-\w]+)/(?P<tag>[-\w]+)/' + cursor, archive_tagged, {}, 'tumblog.tag.cursor'),
     (r'^(?P<blogslug>[-\w]+)/$', archive_index, {}, 'tumblog.index'),
     (r'^(?P<blogslug>[-\w]+)/p/(?P<page>\d+)/$', archive_index, {}, 'tumblog.index.page'),
 )
@@ -0,0 +1,71 @@
+import threading
+import time
+
+class LRUCache(object):
+    """
+    Small thread-safe least recently used cache. Entries optionally expire
+    after timeout seconds.
+    """
+    def __init__(self, size, timeout=None):
+        self.size = size
+        self.timeout = timeout
+        self._items = {}
+        # circular doubly linked list of [prev, next, key], most recent last
+        self._root = root = []
+        root[:] = [root, root, None]
+        self._lock = threading.Lock()
+
+    def _unlink(self, link):
+        prev, next, key = link
+        prev[1] = next
+        next[0] = prev
+
+    def _append(self, link):
+        last = self._root[0]
+        link[0], link[1] = last, self._root
+        last[1] = self._root[0] = link
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            if key not in self._items:
+                return default
+            link, value, expires = self._items[key]
+            self._unlink(link)
+            if expires is not None and expires < time.time():
+                del self._items[key]
+                return default
+            self._append(link)
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        expires = None
+        if self.timeout is not None:
+            expires = time.time() + self.timeout
+
+        self._lock.acquire()
+        try:
+            if key in self._items:
+                link = self._items[key][0]
+                self._unlink(link)
+            else:
+                link = [None, None, key]
+            self._append(link)
+            self._items[key] = (link, value, expires)
+
+            while len(self._items) > self.size:
+                oldest = self._root[1]
+                self._unlink(oldest)
+                del self._items[oldest[2]]
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            if key in self._items:
+                self._unlink(self._items.pop(key)[0])
+        finally:
+            self._lock.release()
@@ -1,6 +1,7 @@
 from django.shortcuts import render_to_response
 from tumblog.models import *
+from tumblog.caching import get_blog
 
 def create(request, blogslug):
-    blog = Blog.objects.get(slug=blogslug)
+    blog = get_blog(blogslug)
     return render_to_response('tumblog/admin_create.html', {'blog': blog})
@@ -0,0 +1,72 @@
+import time
+from email.Utils import parsedate_tz, mktime_tz
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.hashcompat import md5_constructor
+from django.utils.http import http_date
+
+from tumblog.caching import blog_state, stamp
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'TUMBLOG_PAGE_CACHE_TIMEOUT', 0)
+
+def not_modified(request, etag, last_modified):
+    """ Whether the client's copy, as per its conditional GET headers, is current """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None:
+        since = parsedate_tz(if_modified_since.split(';')[0])
+        return since is not None and int(time.mktime(last_modified.timetuple())) <= mktime_tz(since)
+
+    return False
+
+def make_etag(key):
+    return '"%s"' % md5_constructor(key).hexdigest()
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(time.mktime(last_modified.timetuple()))
+
+def cache_archive(view):
+    """
+    Whole page cache for the public views, taking the blog slug as their
+    first argument. Opt in with TUMBLOG_PAGE_CACHE_TIMEOUT (seconds).
+
+    Pages are keyed on the blog slug, the full path (which covers the date,
+    tag, page or cursor) and the blog's last change, so publishing, editing
+    or a scheduled post going live all move on to new keys. The same last
+    change drives ETag/Last-Modified and 304 answers to conditional GETs.
+    """
+    def wrapper(request, blogslug, *args, **kwargs):
+        if not PAGE_CACHE_TIMEOUT or request.method not in ('GET', 'HEAD'):
+            return view(request, blogslug, *args, **kwargs)
+        if hasattr(request, 'user') and request.user.is_authenticated():
+            return view(request, blogslug, *args, **kwargs)
+
+        state = blog_state(blogslug)
+        if state is None:
+            return view(request, blogslug, *args, **kwargs)
+
+        last_modified = state['last_modified']
+        path = md5_constructor(request.get_full_path()).hexdigest()
+        key = 'tumblog.page.%s.%s.%s' % (blogslug, path, stamp(last_modified))
+        etag = make_etag(key)
+
+        if not_modified(request, etag, last_modified):
+            return HttpResponseNotModified()
+
+        response = cache.get(key)
+        if response is None:
+            response = view(request, blogslug, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            set_validators(response, etag, last_modified)
+            cache.set(key, response, PAGE_CACHE_TIMEOUT)
+        return response
+
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+
+from tumblog.caching import get_blog, blog_state
+from tumblog.feeds import FEED_TYPES, feed_cache_key, get_feed
+from tumblog.views.decorators import not_modified, make_etag, set_validators
+
+FEED_CHUNK_SIZE = getattr(settings, 'TUMBLOG_FEED_CHUNK_SIZE', 8192)
+
+def _chunks(data, size=FEED_CHUNK_SIZE):
+    for start in xrange(0, len(data), size):
+        yield data[start:start + size]
+
+def feed(request, blogslug, format='atom', tag=None):
+    """ Atom or RSS feed of the blog's latest posts, optionally by tag. """
+    blog = get_blog(blogslug)
+    state = blog_state(blogslug)
+    etag = make_etag(feed_cache_key(blogslug, format, tag, state['last_modified']))
+
+    if not_modified(request, etag, state['last_modified']):
+        return HttpResponseNotModified()
+
+    data = get_feed(blog, format, tag, state)
+    response = HttpResponse(_chunks(data), mimetype = FEED_TYPES[format].mime_type)
+    set_validators(response, etag, state['last_modified'])
+    return response
@@ -1,63 +1,173 @@
 import datetime
-from django.core.paginator import QuerySetPaginator
-from django.views.generic import list_detail, date_based
+from django.core.paginator import QuerySetPaginator, InvalidPage
+from django.db.models import Q, Sum
 from django.conf import settings
-from django.http import Http404
+from django.http import HttpResponse, HttpResponsePermanentRedirect, Http404
+from django.template import loader, RequestContext
 
 from tagging.models import TaggedItem
-from tumblog.models import Blog, Post
+from tumblog.models import Post
+from tumblog.caching import get_blog
+from tumblog.rendering import prime_post_cache
+from tumblog.views.decorators import cache_archive
+
+def _archive_template(template_name):
+    return loader.get_template(template_name or 'tumblog/post_list.html')
+
+def _cursor_for(post):
+    """ The keyset cursor which continues after the given post """
+    return "%s%06d-%d" % (post.pubtime.strftime('%Y%m%d%H%M%S'), post.pubtime.microsecond, post.pk)
+
+def _parse_cursor(cursor):
+    try:
+        timestamp, post_id = cursor.split('-')
+        pubtime = datetime.datetime.strptime(timestamp[:14], '%Y%m%d%H%M%S')
+        return pubtime.replace(microsecond = int(timestamp[14:])), int(post_id)
+    except ValueError:
+        raise Http404
+
+def _posts_by_date(blog, year, month=None, day=None):
+    """ The blog's posts during the given (url captured) date """
+    try:
+        return blog.posts.by_date(int(year), month and int(month), day and int(day))
+    except ValueError:
+        raise Http404
+
+def _paginated_archive(request, queryset, page=1, extra_context={}, template_name=None, count=None, cursor=None):
+    """
+    Render one page of posts, either by page number or, given a cursor,
+    as the posts following it in (pubtime, id) order. Numbered pages need
+    one COUNT (none if the caller already knows it) and an OFFSET; cursor
+    pages need neither.
+    """
+    # tagging hands back an EmptyQuerySet for unknown tags
+    if hasattr(queryset, 'with_photos'):
+        queryset = queryset.with_photos()
+
+    if cursor is not None:
+        return _cursor_archive(request, queryset, cursor, extra_context, template_name)
 
-def _paginated_archive(request, queryset, page=1, extra_context={}, template_name=None):
     paginator = QuerySetPaginator(queryset, settings.PAGINATION_COUNT)
+    if count is not None:
+        # already known from the archive summary, skip the COUNT
+        paginator._count = count
 
-    # if we're requesting a page, make sure there are enough for it
-    if not int(page) in paginator.page_range:
+    try:
+        page_obj = paginator.page(page)
+    except InvalidPage:
         raise Http404
 
-    options = {
-        'queryset': queryset,
-        'paginate_by': settings.PAGINATION_COUNT,
-        'page': page,
-        'extra_context': extra_context,
+    object_list = list(page_obj.object_list)
+    if 'blog' in extra_context:
+        prime_post_cache(extra_context['blog'], object_list)
+    context = {
+        'object_list': object_list,
+        'paginator': paginator,
+        'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
+        'results_per_page': paginator.per_page,
+        'has_next': page_obj.has_next(),
+        'has_previous': page_obj.has_previous(),
+        'page': page_obj.number,
+        'next': page_obj.next_page_number(),
+        'previous': page_obj.previous_page_number(),
+        'first_on_page': page_obj.start_index(),
+        'last_on_page': page_obj.end_index(),
+        'pages': paginator.num_pages,
+        'hits': paginator.count,
+        'page_range': paginator.page_range,
+        'next_cursor': page_obj.has_next() and _cursor_for(object_list[-1]) or None,
     }
+    context.update(extra_context)
+
+    t = _archive_template(template_name)
+    return HttpResponse(t.render(RequestContext(request, context)))
 
-    return list_detail.object_list(request, **options)
+def _cursor_archive(request, queryset, cursor, extra_context={}, template_name=None):
+    pubtime, post_id = _parse_cursor(cursor)
+    per_page = settings.PAGINATION_COUNT
 
-def archive_index(request, blogslug, page=1, extra_context={}, template_name=None):
+    after = queryset.filter(Q(pubtime__lt = pubtime) | Q(pubtime = pubtime, id__lt = post_id))
+    object_list = list(after.order_by('-pubtime', '-id')[:per_page + 1])
+    if not object_list:
+        raise Http404
+
+    # the extra post only tells us whether there's another page
+    has_next = len(object_list) > per_page
+    object_list = object_list[:per_page]
+    if 'blog' in extra_context:
+        prime_post_cache(extra_context['blog'], object_list)
+
+    context = {
+        'object_list': object_list,
+        'is_paginated': True,
+        'results_per_page': per_page,
+        'has_next': has_next,
+        'has_previous': True,
+        'cursor': cursor,
+        'next_cursor': has_next and _cursor_for(object_list[-1]) or None,
+    }
+    context.update(extra_context)
+
+    t = _archive_template(template_name)
+    return HttpResponse(t.render(RequestContext(request, context)))
+
+@cache_archive
+def archive_index(request, blogslug, page=1, extra_context={}, template_name=None, cursor=None):
     """ index view of posts """
-    blog = Blog.objects.get(slug=blogslug)
-    return _paginated_archive(request, blog.posts, page, dict(extra_context, **{'blog': blog}), template_name)
+    blog = get_blog(blogslug)
+    return _paginated_archive(request, blog.posts, page, dict(extra_context, **{'blog': blog}), template_name, cursor=cursor)
 
-def archive_year(request, blogslug, year, page=1, extra_context={}, template_name=None):
+@cache_archive
+def archive_year(request, blogslug, year, page=1, extra_context={}, template_name=None, cursor=None):
     """ date based index of tumblog posts. """
-    blog = Blog.objects.get(slug=blogslug)
-    queryset = blog.posts.filter(pubtime__year = year)
+    blog = get_blog(blogslug)
+    count = blog.month_counts.filter(year = year).aggregate(count = Sum('post_count'))['count'] or 0
+    queryset = _posts_by_date(blog, year)
     viewname = "posted during %s" % year
-    return _paginated_archive(request, queryset, page, dict(extra_context, **{'blog': blog, 'viewname': viewname}), template_name)
+    return _paginated_archive(request, queryset, page, dict(extra_context, **{'blog': blog, 'viewname': viewname}), template_name, count, cursor=cursor)
 
-def archive_month(request,blogslug,  year, month, page=1, extra_context={}, template_name=None):
+@cache_archive
+def archive_month(request,blogslug,  year, month, page=1, extra_context={}, template_name=None, cursor=None):
     """ date based index of tumblog posts. """
-    blog = Blog.objects.get(slug=blogslug)
-    queryset = blog.posts.filter(pubtime__year = year, pubtime__month = month)
+    blog = get_blog(blogslug)
+    count = sum(blog.month_counts.filter(year = year, month = month).values_list('post_count', flat = True))
+    queryset = _posts_by_date(blog, year, month)
     viewname = "posted during %s/%s" % (year, month)
-    return _paginated_archive(request, queryset, page, dict(extra_context, **{'blog': blog, 'viewname': viewname}), template_name)
+    return _paginated_archive(request, queryset, page, dict(extra_context, **{'blog': blog, 'viewname': viewname}), template_name, count, cursor=cursor)
 
-def archive_day(request, blogslug, year, month, day, page=1, extra_context={}, template_name=None):
+@cache_archive
+def archive_day(request, blogslug, year, month, day, page=1, extra_context={}, template_name=None, cursor=None):
     """ date based index of tumblog posts. """
-    blog = Blog.objects.get(slug=blogslug)
-    queryset = blog.posts.filter(pubtime__year = year, pubtime__month = month, pubtime__day = day)
+    blog = get_blog(blogslug)
+    queryset = _posts_by_date(blog, year, month, day)
     viewname = "posted on %s/%s/%s" % (year, month, day)
-    return _paginated_archive(request, queryset, page, dict(extra_context, **{'blog': blog, 'viewname': viewname}), template_name)
+    return _paginated_archive(request, queryset, page, dict(extra_context, **{'blog': blog, 'viewname': viewname}), template_name, cursor=cursor)
 
-def archive_tagged(request, blogslug, tag, page=1, extra_context={}, template_name=None):
-    blog = Blog.objects.get(slug=blogslug)
+@cache_archive
+def archive_tagged(request, blogslug, tag, page=1, extra_context={}, template_name=None, cursor=None):
+    blog = get_blog(blogslug)
     queryset = TaggedItem.objects.get_by_model(blog.posts, tag)
     viewname = "tagged: '%s'" % tag
-    return _paginated_archive(request, queryset, page, dict(extra_context, **{'blog': blog, 'viewname': viewname}), template_name)
+    return _paginated_archive(request, queryset, page, dict(extra_context, **{'blog': blog, 'viewname': viewname}), template_name, cursor=cursor)
 
+@cache_archive
 def archive_detail(request, blogslug, year, month, day, slug, extra_context={}, template_name=None):
-    blog = Blog.objects.get(slug=blogslug)
-    queryset = blog.posts.filter(pubtime__year = year, pubtime__month = month, pubtime__day = day)
-    context = dict(extra_context, **{'blog': blog})
-    return list_detail.object_detail(request, queryset, **{'slug': slug, 'slug_field': 'slug', 'extra_context': context})
+    """
+    Single post view. Slugs are unique, so the post is looked up by slug
+    alone; a permalink with the wrong date redirects to the right one.
+    """
+    blog = get_blog(blogslug)
+    try:
+        post = blog.posts.with_photos().get(slug = slug)
+    except Post.DoesNotExist:
+        raise Http404
+
+    post.blog = blog
+    if post.pubtime.strftime('%Y/%m/%d') != "%04d/%02d/%02d" % (int(year), int(month), int(day)):
+        return HttpResponsePermanentRedirect(post.get_absolute_url())
 
+    context = {'object': post}
+    context.update(dict(extra_context, **{'blog': blog}))
+    t = loader.get_template(template_name or 'tumblog/post_detail.html')
+    return HttpResponse(t.render(RequestContext(request, context)))
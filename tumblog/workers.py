@@ -0,0 +1,98 @@
+"""
+Helpers for farming CPU bound work (Markdown, thumbnails) out to a pool
+of worker processes.
+"""
+import threading
+from django.conf import settings
+from django.core import signals
+
+WORKER_PROCESSES = getattr(settings, 'TUMBLOG_WORKER_PROCESSES', None)
+
+def parallel_map(func, items, processes=None):
+    """
+    map() over a pool of worker processes, one per core unless processes
+    (or TUMBLOG_WORKER_PROCESSES) says otherwise. func must be a module
+    level function, and it must not touch the database. With a single
+    process, or without multiprocessing, this is a plain map().
+    """
+    items = list(items)
+    if processes is None:
+        processes = WORKER_PROCESSES
+
+    try:
+        from multiprocessing import Pool, cpu_count
+    except ImportError:
+        return map(func, items)
+
+    if processes is None:
+        processes = cpu_count()
+    processes = min(processes, len(items))
+    if processes <= 1:
+        return map(func, items)
+
+    pool = Pool(processes)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+_background = None
+# calls deferred by the request being handled on this thread, if any
+_local = threading.local()
+
+def defer(func, *args):
+    """
+    Run func(*args) on a background thread. Within a request it's handed
+    over once the request is finished, and its transaction committed, so
+    func sees what the request saved; elsewhere right away. The threads
+    (TUMBLOG_BACKGROUND_THREADS of them) are started on first use and
+    close their database connection after each call.
+    """
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending.append((func, args))
+    else:
+        _run_in_background(func, args)
+
+def _run_in_background(func, args):
+    global _background
+    if _background is None:
+        _background = _start_background(getattr(settings, 'TUMBLOG_BACKGROUND_THREADS', 2))
+    _background.put((func, args))
+
+def _request_started(sender, **kwargs):
+    _local.pending = []
+
+def _request_finished(sender, **kwargs):
+    pending = getattr(_local, 'pending', None)
+    _local.pending = None
+    for func, args in pending or ():
+        _run_in_background(func, args)
+
+signals.request_started.connect(_request_started, dispatch_uid = 'tumblog.workers.request_started')
+signals.request_finished.connect(_request_finished, dispatch_uid = 'tumblog.workers.request_finished')
+
+def _start_background(threads):
+    from Queue import Queue
+
+    queue = Queue()
+    for i in range(threads):
+        worker = threading.Thread(target = _background_worker, args = (queue,))
+        worker.setDaemon(True)
+        worker.start()
+    return queue
+
+def _background_worker(queue):
+    import logging
+    from django.db import connection
+
+    while True:
+        func, args = queue.get()
+        try:
+            try:
+                func(*args)
+            except Exception:
+                logging.exception("tumblog background job %r failed" % func)
+        finally:
+            connection.close()